@@ -0,0 +1,23 @@
+# Writes the url and user index rows for summaries saved before the index tables existed.
+#   python backfill_indexes.py --start 2024-02-01
+import argparse
+import logging
+from datetime import date
+
+from summarizer.database import backfill_summary_indexes
+from summarizer.export import FIRST_PARTITION_DATE, partition_keys
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logging.getLogger("azure").setLevel(logging.WARNING)
+
+parser = argparse.ArgumentParser(description="Backfill summary index tables")
+parser.add_argument("--start", type=date.fromisoformat, default=FIRST_PARTITION_DATE)
+parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+args = parser.parse_args()
+
+for partition_key in partition_keys(args.start, args.end):
+    count = backfill_summary_indexes(partition_key)
+    if count > 0:
+        logging.info(f"Indexed {count} summaries from {partition_key}")
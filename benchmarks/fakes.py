@@ -0,0 +1,133 @@
+"""
+In-memory stand-ins for Azure storage and Telegram, so the bot's handlers can run offline.
+"""
+import asyncio
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+import summarizer.database as database
+
+_parameter_regex = re.compile(r"(\w+) eq @(\w+)")
+
+
+class FakeTableClient:
+    def __init__(self):
+        self.rows = {}
+        self.transactions = 0
+        self.lock = threading.Lock()
+
+    def create_entity(self, entity):
+        key = (entity["PartitionKey"], entity["RowKey"])
+        with self.lock:
+            if key in self.rows:
+                raise ResourceExistsError("Entity already exists")
+            self.rows[key] = dict(entity)
+
+    def upsert_entity(self, entity):
+        with self.lock:
+            self.rows[(entity["PartitionKey"], entity["RowKey"])] = dict(entity)
+
+    def submit_transaction(self, operations):
+        with self.lock:
+            self.transactions += 1
+        for _, entity in operations:
+            self.upsert_entity(entity)
+
+    def get_entity(self, partition_key, row_key):
+        with self.lock:
+            if (partition_key, row_key) not in self.rows:
+                raise ResourceNotFoundError("Entity not found")
+            return dict(self.rows[(partition_key, row_key)])
+
+    def query_entities(self, query_filter, parameters=None, **kwargs):
+        # Only supports filters of the form "a eq @a and b eq @b", which is all the bot uses
+        conditions = {
+            field: (parameters or {})[name]
+            for field, name in _parameter_regex.findall(query_filter)
+        }
+        with self.lock:
+            rows = [row for _, row in sorted(self.rows.items())]
+        return iter(
+            [
+                dict(row)
+                for row in rows
+                if all(row.get(field) == value for field, value in conditions.items())
+            ]
+        )
+
+
+class FakeBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+
+    def upload_blob(self, data, overwrite=False):
+        with self.container.lock:
+            if not overwrite and self.name in self.container.blobs:
+                raise ResourceExistsError("Blob already exists")
+            self.container.blobs[self.name] = data
+
+    def download_blob(self):
+        with self.container.lock:
+            if self.name not in self.container.blobs:
+                raise ResourceNotFoundError("Blob not found")
+            data = self.container.blobs[self.name]
+        return SimpleNamespace(readall=lambda: data)
+
+
+class FakeContainerClient:
+    def __init__(self):
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def get_blob_client(self, name):
+        return FakeBlob(self, name)
+
+
+def install_fake_storage(user_ids: list[int]):
+    """Replaces the storage clients in summarizer.database and authorizes the given users"""
+    database.summaries_table_client = FakeTableClient()
+    database.summaries_by_url_table_client = FakeTableClient()
+    database.summaries_by_user_table_client = FakeTableClient()
+    database.users_table_client = FakeTableClient()
+    database.invite_codes_table_client = FakeTableClient()
+    database.articles_container_client = FakeContainerClient()
+    for user_id in user_ids:
+        database.users_table_client.create_entity(
+            {"PartitionKey": str(user_id), "RowKey": str(user_id), "user_id": user_id}
+        )
+
+
+class FakeMessage:
+    def __init__(self, text: str):
+        self.text = text
+        self.replies = []
+        self.created = time.perf_counter()
+
+    async def reply_text(self, text, **kwargs):
+        # Sending a Telegram message is a network call, so give other tasks a chance to run
+        await asyncio.sleep(0)
+        self.replies.append((time.perf_counter() - self.created, text))
+
+    async def reply_html(self, text, **kwargs):
+        await self.reply_text(text, **kwargs)
+
+
+def make_update(user_id: int, text: str):
+    """A minimal stand-in for telegram.Update with the fields the handlers use"""
+    user = SimpleNamespace(id=user_id, full_name=f"Benchmark user {user_id}")
+    return SimpleNamespace(effective_user=user, message=FakeMessage(text))
+
+
+def dump_storage_stats() -> dict:
+    return {
+        "summaries": len(database.summaries_table_client.rows),
+        "articles": len(database.articles_container_client.blobs),
+        "article_bytes": sum(
+            len(blob) for blob in database.articles_container_client.blobs.values()
+        ),
+    }
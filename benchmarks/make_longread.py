@@ -0,0 +1,218 @@
+"""
+Generates a long synthetic article for the benchmark corpus.
+
+The hand-written pages in the corpus are a few KB each, well below MAX_CHUNK_LENGTH, so on their own they
+never exercise split_text or chunked summaries. This page has over 32k chars of article text inside the
+kind of markup real news sites serve (navigation, inline scripts and styles, related links), so a default
+benchmark run covers chunking and extraction of a large page. Output is deterministic for a given seed.
+
+    python -m benchmarks.make_longread
+"""
+import argparse
+import os
+import random
+
+from benchmarks.run_pipeline import CORPUS_DIR
+
+TITLE = "The long drought: how the river basin ran out of water, and what comes next"
+MIN_TEXT_LENGTH = 40_000
+
+PLACES = [
+    "Ashford", "Bellmere", "Carrow", "Dunmore", "Eastvale", "Fenwick", "Glenholm", "Harlow",
+    "Ivybridge", "Kelso", "Langley", "Marsden", "Northam", "Oakridge", "Penrith", "Redcliff",
+]
+PEOPLE = [
+    ("Maria Okafor", "a hydrologist at the state university"),
+    ("Tom Lindqvist", "who farms barley and canola on the northern plains"),
+    ("Priya Raman", "the basin authority's chief engineer"),
+    ("David Cheng", "an economist who studies water markets"),
+    ("Helen Murray", "the mayor of a river town"),
+    ("Samuel Adeyemi", "who runs a small irrigation cooperative"),
+    ("Claire Dubois", "a lawyer representing downstream users"),
+    ("Ahmed Karim", "a former official at the environment ministry"),
+]
+CROPS = ["rice", "cotton", "almonds", "wheat", "citrus", "grapes", "dairy pasture", "vegetables"]
+SECTIONS = [
+    "A river in retreat",
+    "Counting every drop",
+    "The farmers' dilemma",
+    "Towns on the edge",
+    "A market for water",
+    "What the science says",
+    "Politics upstream and down",
+    "The price of doing nothing",
+    "Engineering a way out",
+    "Lessons from elsewhere",
+    "The next ten years",
+]
+SENTENCES = [
+    "Inflows to the {place} reservoir fell to {pct} per cent of the long-term average last year, the lowest since records began in {year}.",
+    "By the end of summer the weir at {place} was dry for the first time in living memory, and the pumps that feed the town's treatment plant sucked air.",
+    "{name}, {role}, said the basin had been allocating water it did not have for at least two decades.",
+    "\"We built an economy on the wettest fifty years of the last five centuries,\" said {name}, {role}.",
+    "Irrigators around {place} received {pct} per cent of their entitlements this season, down from {pct2} per cent five years ago.",
+    "Growers of {crop} have been hit hardest, because the crop needs water every year and cannot simply be left fallow.",
+    "Some farmers have switched from {crop} to {crop2}, which uses less water but earns far less per hectare.",
+    "The price of a megalitre of temporary water on the open market reached {price} dollars in {month}, more than {mult} times the price three years earlier.",
+    "Groundwater levels in the {place} aquifer have dropped by {metres} metres since {year}, according to monitoring bores maintained by the state.",
+    "The authority's own modelling suggests average flows could fall by a further {pct} per cent by {future}, even under moderate emissions scenarios.",
+    "{name}, {role}, warned that the models may be too optimistic, because they assume soils will respond to rain the way they did in the past.",
+    "In {place}, the council has imposed level {level} restrictions, banning garden watering and limiting showers to four minutes.",
+    "The town spent {million} million dollars trucking in drinking water during the worst months, a cost it is still repaying.",
+    "Local businesses report that trade has fallen by around {pct} per cent as farm incomes shrink and young families move to the coast.",
+    "Wetlands near {place} that once hosted tens of thousands of waterbirds have shrunk to a handful of muddy pools.",
+    "Scientists counted {count} breeding pairs of ibis at the site last spring, compared with more than {count2} a decade ago.",
+    "Environmental flows, the water set aside for rivers and wetlands, are often the first thing cut when allocations are reduced.",
+    "A review commissioned in {year} found that {pct} per cent of licensed extractions in the upper catchment were not metered at all.",
+    "Since then, meters have been installed on most large pumps, but enforcement remains patchy and fines are rarely issued.",
+    "{name}, {role}, said the cooperative had spent {million} million dollars lining channels to stop seepage, saving roughly {pct} per cent of its losses.",
+    "Critics argue that efficiency upgrades often increase total use, because the water saved is simply used to irrigate more land.",
+    "Economists call this the rebound effect, and studies in several basins have found evidence that it is real.",
+    "The water market was meant to move water to its most valuable use, and in many ways it has, shifting supply from pasture to orchards.",
+    "But orchards cannot be switched off in a dry year, which makes demand less flexible exactly when supply is most uncertain.",
+    "{name}, {role}, said investors who bought entitlements as a financial asset now hold about {pct} per cent of the water in some valleys.",
+    "Downstream users say the upper states take more than their share, while upstream irrigators say they are blamed for a drought they did not cause.",
+    "A ministerial council meeting in {month} ended without agreement on a new sharing plan, the {nth} such meeting to fail since {year}.",
+    "The federal government has offered {million} million dollars to buy back entitlements from willing sellers, a policy that remains deeply unpopular in farm towns.",
+    "Buybacks are the cheapest way to return water to the river, according to an analysis by the national audit office, but they hollow out local economies.",
+    "Infrastructure projects such as pipelines and new dams are popular with voters but cost far more per megalitre recovered.",
+    "A proposed dam near {place} would cost an estimated {million} million dollars and, in a dry year, might not fill at all.",
+    "Desalination plants on the coast now supply about {pct} per cent of the capital's drinking water, easing pressure on inland storages.",
+    "Recycled water is used on parks and sporting fields in {place}, and the council wants to extend it to nearby market gardens.",
+    "Engineers at the authority are testing whether water can be stored underground in the {place} aquifer during wet years and recovered in dry ones.",
+    "Early trials recovered about {pct} per cent of the water injected, which the authority describes as promising.",
+    "Other basins offer mixed lessons: some cut allocations early and recovered, others waited and saw rivers stop flowing altogether.",
+    "{name}, {role}, pointed to a basin overseas where a binding cap on extractions, set in {year}, has held through two severe droughts.",
+    "Traditional owners along the river say they have been largely excluded from decisions about water, despite holding deep knowledge of its cycles.",
+    "A small allocation for cultural flows was agreed in {year}, but only a fraction of it has ever been delivered.",
+    "Rainfall in the catchment has been below average in {nyears} of the last {nyears2} years, and the wet years have not been wet enough to refill the storages.",
+    "Higher temperatures also mean more evaporation: the authority estimates that the {place} storage loses about {gl} gigalitres a year to the air.",
+    "{name}, {role}, said the debate too often treats the drought as a temporary emergency rather than a lasting change.",
+    "\"Every plan we have assumes the rain will come back,\" said {name}, {role}. \"We need plans that work if it doesn't.\"",
+    "The state's draft water strategy, released in {month}, sets a target of cutting per-person urban use to {litres} litres a day by {future}.",
+    "Farm lobby groups have welcomed the focus on infrastructure but criticised what they call an open-ended commitment to further buybacks.",
+    "Conservation groups say the strategy does too little for the lower river, where salinity has risen to levels that threaten the remaining fish.",
+    "Fish kills near {place} in {year} left millions of native fish dead after a sudden drop in oxygen, an event scientists linked directly to low flows.",
+    "Since then, the authority has installed aerators and real-time oxygen monitors at {count} sites along the lower river.",
+    "For many families in {place}, the drought is less a policy question than a daily calculation about whether to stay.",
+    "{name}, {role}, said their children were the first generation in the family unlikely to take over the farm.",
+]
+
+
+def fill(template: str, rng: random.Random) -> str:
+    name, role = rng.choice(PEOPLE)
+    crop, crop2 = rng.sample(CROPS, 2)
+    return template.format(
+        place=rng.choice(PLACES),
+        name=name,
+        role=role,
+        crop=crop,
+        crop2=crop2,
+        pct=rng.randint(8, 45),
+        pct2=rng.randint(50, 95),
+        year=rng.randint(1890, 2019),
+        future=rng.choice([2030, 2035, 2040, 2050]),
+        price=rng.randint(300, 1400),
+        mult=rng.randint(2, 6),
+        month=rng.choice(["March", "May", "July", "September", "November"]),
+        metres=rng.randint(2, 25),
+        level=rng.randint(2, 5),
+        million=rng.randint(3, 900),
+        count=rng.randint(12, 300),
+        count2=rng.randint(5000, 40000),
+        nth=rng.choice(["third", "fourth", "fifth", "sixth"]),
+        nyears=rng.randint(6, 9),
+        nyears2=10,
+        gl=rng.randint(20, 400),
+        litres=rng.randint(130, 190),
+    )
+
+
+def paragraphs(rng: random.Random):
+    """Yields (section heading or None, paragraph) until the article is long enough"""
+    length = 0
+    section = 0
+    while length < MIN_TEXT_LENGTH:
+        if length >= (section * MIN_TEXT_LENGTH) // len(SECTIONS):
+            yield SECTIONS[section % len(SECTIONS)], None
+            section += 1
+        templates = rng.sample(SENTENCES, rng.randint(3, 5))
+        paragraph = " ".join(fill(t, rng) for t in templates)
+        length += len(paragraph)
+        yield None, paragraph
+
+
+def chrome(rng: random.Random) -> tuple[str, str, str]:
+    """Navigation, inline styles and scripts, and related links, as served around real articles"""
+    nav = "\n".join(
+        f'<li class="nav-item"><a class="nav-link" href="/section/{s.lower().replace(" ", "-")}">{s}</a></li>'
+        for s in ["News", "World", "Business", "Politics", "Environment", "Science", "Opinion", "Sport"] * 6
+    )
+    style = "\n".join(
+        f".c{i} {{ margin: {i % 7}px {i % 5}px; color: #{rng.randrange(16**6):06x}; font-size: {12 + i % 6}px; }}"
+        for i in range(800)
+    )
+    script = "window.__CONFIG__ = {" + ",".join(
+        f'"flag_{i}": {str(rng.random() < 0.5).lower()}' for i in range(1500)
+    ) + "};"
+    related = "\n".join(
+        f'<li><a href="/news/{rng.randrange(10**8)}">{fill(rng.choice(SENTENCES), rng)[:90]}</a></li>'
+        for _ in range(60)
+    )
+    return nav, f"<style>\n{style}\n</style>\n<script>{script}</script>", related
+
+
+def make_page(seed: int = 0) -> str:
+    rng = random.Random(seed)
+    nav, head_extra, related = chrome(rng)
+    body = []
+    for heading, paragraph in paragraphs(rng):
+        if heading is not None:
+            body.append(f"<h2>{heading}</h2>")
+        else:
+            body.append(f"<p>{paragraph}</p>")
+        if len(body) % 9 == 0:
+            body.append("<p>Advertisement</p>")
+    return "\n".join(
+        [
+            "<!DOCTYPE html>",
+            '<html lang="en">',
+            "<head>",
+            '<meta charset="utf-8">',
+            f"<title>{TITLE}</title>",
+            head_extra,
+            "</head>",
+            "<body>",
+            f'<header><nav><ul class="nav">\n{nav}\n</ul></nav></header>',
+            "<main>",
+            "<article>",
+            f"<h1>{TITLE}</h1>",
+            '<p class="byline">By Environment Correspondent, March 18, 2024</p>',
+            *body,
+            "<p>Sign up for our daily newsletter to get the top stories in your inbox.</p>",
+            "</article>",
+            f'<aside><h2>Related stories</h2><ul class="related">\n{related}\n</ul></aside>',
+            "</main>",
+            "<footer><p>© 2024 The Daily Example. All rights reserved.</p></footer>",
+            "</body>",
+            "</html>",
+            "",
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    path = os.path.join(args.corpus, "longread-river-drought.html")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(make_page(args.seed))
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Downloads pages into the benchmark corpus, so benchmarks replay real HTML without hitting the network.
+
+    python -m benchmarks.record_corpus https://example.com/article another-name=https://example.com/other
+"""
+import argparse
+import os
+import re
+from urllib.parse import urlparse
+
+from summarizer.text import fetch_html
+
+from benchmarks.run_pipeline import CORPUS_DIR
+
+
+def name_for(url: str) -> str:
+    parsed = urlparse(url)
+    slug = re.sub(r"[^\w]+", "-", f"{parsed.netloc}{parsed.path}").strip("-")
+    return slug[:80]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("urls", nargs="+", help="url, or name=url to pick the file name")
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    args = parser.parse_args()
+
+    for arg in args.urls:
+        name, _, url = arg.partition("=") if "=http" in arg else ("", "", arg)
+        name = name or name_for(url)
+        downloaded = fetch_html(url)
+        if downloaded is None:
+            print(f"Could not download {url}")
+            continue
+        path = os.path.join(args.corpus, f"{name}.html")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(downloaded)
+        print(f"Saved {url} to {path}")
+
+
+if __name__ == "__main__":
+    main()
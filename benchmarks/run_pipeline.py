@@ -0,0 +1,297 @@
+"""
+Offline end-to-end benchmark of the summarize_guess pipeline.
+
+Replays an HTML corpus through get_text, split_text, summarize_openai and save_summary,
+with a local mock LLM server and in-memory storage, driven by synthetic Telegram updates.
+Writes per-stage latency percentiles, throughput and peak memory as JSON.
+
+The default corpus is synthetic: three short hand-written pages and one long page from make_longread.py,
+which is over MAX_CHUNK_LENGTH so every run covers chunked summaries. Add real pages with record_corpus.py.
+
+    python -m benchmarks.run_pipeline --requests 200 --concurrency 20 --out out/bench.json
+    python -m benchmarks.run_pipeline --compare out/bench.json
+"""
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import logging
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from summarizer.mock_llm import start_mock_llm_server
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+BENCHMARK_USER_ID = 1111111
+PERCENTILES = [50, 95, 99]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="Directory of .html files")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.2, help="Mock LLM seconds per request"
+    )
+    parser.add_argument(
+        "--llm-tokens-per-second",
+        type=float,
+        default=None,
+        help="Mock LLM generation speed, adds max_tokens / rate seconds per request",
+    )
+    parser.add_argument(
+        "--fetch-latency",
+        type=float,
+        default=0.0,
+        help="Simulated network time to download a page, in seconds",
+    )
+    parser.add_argument(
+        "--chunk-length",
+        type=int,
+        default=None,
+        help="Override the max chunk length, to exercise chunked summaries with a small corpus",
+    )
+    parser.add_argument(
+        "--production-rate-limit",
+        action="store_true",
+        help="Keep the production LLM rate limiter instead of disabling it",
+    )
+    parser.add_argument(
+        "--repeat-urls",
+        action="store_true",
+        help="Reuse the same url per corpus page, so later requests hit the caches",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="Also report peak Python heap usage. Slows the benchmark down.",
+    )
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Compare results against an earlier JSON file")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=None,
+        help="With --compare, exit with an error if any p95 is this fraction slower, e.g. 0.2",
+    )
+    return parser.parse_args()
+
+
+def load_corpus(corpus_dir: str) -> dict[str, str]:
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(corpus_dir, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as file:
+            pages[name] = file.read()
+    if len(pages) == 0:
+        raise ValueError(f"No .html files found in {corpus_dir}")
+    return pages
+
+
+class StageTimer:
+    def __init__(self):
+        self.durations = defaultdict(list)
+
+    def wrap(self, name, fn):
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.durations[name].append(time.perf_counter() - start)
+
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.durations[name].append(time.perf_counter() - start)
+
+        return timed
+
+    def patch(self, module, attribute, name=None):
+        setattr(module, attribute, self.wrap(name or attribute, getattr(module, attribute)))
+
+
+def percentile(values: list[float], p: float) -> float:
+    # Nearest rank, so the result is always an observed value: the smallest value
+    # with at least p% of the values at or below it, e.g. p50 of 1..100 is 50.
+    ordered = sorted(values)
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize_durations(durations: list[float]) -> dict:
+    stats = {"count": len(durations), "mean": sum(durations) / len(durations)}
+    for p in PERCENTILES:
+        stats[f"p{p}"] = percentile(durations, p)
+    return stats
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run_benchmark(args, timer: StageTimer) -> dict:
+    # Imported here so that LLM_BASE_URL is set before the OpenAI client is created
+    from aiolimiter import AsyncLimiter
+
+    import summarizer.bot_handlers as bot_handlers
+    import summarizer.openai_summarizer as openai_summarizer
+    import summarizer.text as text
+    from benchmarks.fakes import dump_storage_stats, install_fake_storage, make_update
+
+    logging.getLogger().setLevel(logging.WARNING)
+    install_fake_storage([BENCHMARK_USER_ID])
+    corpus = load_corpus(args.corpus)
+    names = list(corpus)
+
+    def fetch_html(url):
+        if args.fetch_latency:
+            time.sleep(args.fetch_latency)
+        return corpus[url.rstrip("/").rsplit("/", 1)[-1]]
+
+    text.fetch_html = timer.wrap("fetch", fetch_html)
+    timer.patch(text, "extract_text", "extract")
+    timer.patch(bot_handlers, "read_cached_summary", "cache_lookup_summary")
+    timer.patch(bot_handlers, "get_text")
+    timer.patch(bot_handlers, "compact_text", "compact")
+    timer.patch(bot_handlers, "summarize_openai")
+    timer.patch(bot_handlers, "save_summary")
+    timer.patch(openai_summarizer, "completions", "llm_call")
+    split_text = openai_summarizer.split_text
+    if args.chunk_length:
+        openai_summarizer.MAX_CHUNK_LENGTH = args.chunk_length
+        split_text = functools.partial(split_text, max_length=args.chunk_length)
+    openai_summarizer.split_text = timer.wrap("split_text", split_text)
+    if not args.production_rate_limit:
+        openai_summarizer.rate_limit = AsyncLimiter(10**9, 1)
+
+    limit = asyncio.Semaphore(args.concurrency)
+    updates = []
+
+    async def send(i):
+        name = names[i % len(names)]
+        if args.repeat_urls:
+            url = f"https://bench.example.com/{name}"
+        else:
+            # A unique url per request, so every request misses the caches
+            url = f"https://bench.example.com/{i}/{name}"
+        update = make_update(BENCHMARK_USER_ID, f"Please summarize {url}")
+        updates.append(update)
+        async with limit:
+            await timer.wrap("end_to_end", bot_handlers.summarize_guess)(update, None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[send(i) for i in range(args.requests)])
+    elapsed = time.perf_counter() - start
+
+    failed = sum(
+        1
+        for update in updates
+        if not any(text.startswith("-") for _, text in update.message.replies)
+    )
+    return {
+        "elapsed_seconds": elapsed,
+        "throughput_rps": args.requests / elapsed,
+        "failed_requests": failed,
+        "storage": dump_storage_stats(),
+    }
+
+
+def compare(results: dict, baseline_path: str, max_regression: float | None) -> bool:
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    print(f"Comparing against {baseline_path} ({baseline.get('git_commit')})")
+    print(f"{'stage':<20}{'p50 base':>12}{'p50 now':>12}{'p95 base':>12}{'p95 now':>12}{'change':>10}")
+    ok = True
+    for stage, stats in results["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        base = baseline["stages"][stage]
+        change = (stats["p95"] - base["p95"]) / base["p95"] if base["p95"] > 0 else 0.0
+        print(
+            f"{stage:<20}{base['p50']:>12.4f}{stats['p50']:>12.4f}"
+            f"{base['p95']:>12.4f}{stats['p95']:>12.4f}{change:>+10.1%}"
+        )
+        if max_regression is not None and change > max_regression:
+            ok = False
+    print(
+        f"throughput: {baseline['throughput_rps']:.2f} -> {results['throughput_rps']:.2f} req/s, "
+        f"peak rss: {baseline['peak_rss_mb']:.1f} -> {results['peak_rss_mb']:.1f} MB"
+    )
+    return ok
+
+
+def main():
+    args = parse_args()
+    server = start_mock_llm_server(
+        latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second
+    )
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1/"
+    os.environ.setdefault("LEPTON_API_KEY", "benchmark")
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    timer = StageTimer()
+    run_results = asyncio.run(run_benchmark(args, timer))
+    server.shutdown()
+    if "split_text" not in timer.durations:
+        logging.warning(
+            "No page in the corpus was long enough to be chunked, so chunked summaries were not benchmarked. "
+            "Add a longer page or pass --chunk-length."
+        )
+
+    results = {
+        "git_commit": git_commit(),
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("out", "compare", "max_regression")
+        },
+        **run_results,
+        "stages": {
+            name: summarize_durations(durations)
+            for name, durations in timer.durations.items()
+        },
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.tracemalloc:
+        results["peak_python_heap_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare and not compare(results, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
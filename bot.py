@@ -1,4 +1,5 @@
 import logging
+import os
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -11,13 +12,23 @@ from summarizer.bot_handlers import (
     help_command,
     report_command,
     disagree_command,
+    history_command,
+    retry_command,
     start,
     summarize_guess,
 )
+from summarizer.telemetry import configure_otlp_export, start_metrics_server
+
+# Prometheus scrapes /metrics on this port. Set METRICS_HOST=0.0.0.0 to scrape it from another host.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
 
 
 def run_bot() -> None:
     """Start the bot."""
+    configure_otlp_export()
+    start_metrics_server(METRICS_PORT, METRICS_HOST)
+
     # Create the Application and pass it your bot's token.
     application = Application.builder().token(telegram_bot_token).build()
 
@@ -26,6 +37,8 @@ def run_bot() -> None:
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("report", report_command))
     application.add_handler(CommandHandler("disagree", disagree_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("retry", retry_command))
 
     # on non command i.e message - echo the message on Telegram
     application.add_handler(
@@ -0,0 +1,62 @@
+# Summarizes every article in one or more feeds and writes a digest, pre-warming the summary cache.
+#   python digest.py --feed hackernews --feed reddit:news
+#   python digest.py --feed file:urls.txt --out out/digest.md
+import argparse
+import asyncio
+import logging
+import os
+
+from summarizer.feeds import read_feeds
+from summarizer.pipeline import DEFAULT_STAGE_CONCURRENCY, format_digest, run_pipeline
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Summarize feeds into a digest")
+    parser.add_argument(
+        "--feed",
+        action="append",
+        required=True,
+        help="hackernews, reddit:<subreddit> or file:<path>. Can be repeated.",
+    )
+    parser.add_argument("--limit", type=int, default=None, help="Max urls per feed")
+    parser.add_argument("--out", default="out/digest.md")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Summarize again even if a summary is cached",
+    )
+    for stage, workers in DEFAULT_STAGE_CONCURRENCY.items():
+        parser.add_argument(
+            f"--{stage}-workers",
+            type=int,
+            default=workers,
+            help=f"Concurrency of the {stage} stage",
+        )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    urls = await read_feeds(args.feed, args.limit)
+    concurrency = {
+        stage: getattr(args, f"{stage}_workers") for stage in DEFAULT_STAGE_CONCURRENCY
+    }
+    results = await run_pipeline(urls, concurrency=concurrency, force=args.force)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as file:
+        file.write(format_digest(results))
+    statuses = [r["status"] for r in results]
+    logging.info(
+        f"Wrote digest to {args.out}. "
+        + ", ".join(f"{s}: {statuses.count(s)}" for s in sorted(set(statuses)))
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+# Exports the summaries table, only fetching rows added since the last run.
+#   python export_summaries.py
+#   python export_summaries.py --format parquet --type bullet_point_chunked --with-article-text
+import argparse
+import logging
+import os
+from datetime import date, datetime
+
+from summarizer.export import DEFAULT_PARTITION_WORKERS, export_summaries
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+)
+logging.getLogger("azure").setLevel(logging.WARNING)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export summaries incrementally")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--out-dir", default="out")
+    parser.add_argument("--type", help="e.g. bullet_point, bullet_point_chunked, rebuttal")
+    parser.add_argument("--model", help="Summary or rebuttal model")
+    parser.add_argument("--user", type=int, help="Telegram user id")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day, YYYY-MM-DD")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the high-water mark and export everything again, replacing the JSONL file",
+    )
+    parser.add_argument(
+        "--with-article-text",
+        action="store_true",
+        help="Add the article text from blob storage to chunked summaries",
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_PARTITION_WORKERS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.out_dir, exist_ok=True)
+    # Filtered exports keep their own high-water mark and JSONL file,
+    # so they neither skip nor repeat rows of other exports
+    filters = {"summary_type": args.type, "model": args.model, "user_id": args.user}
+    suffix = "".join(f"-{v}" for v in filters.values() if v is not None)
+    if args.format == "parquet":
+        run_id = datetime.now().strftime("%Y%m%dT%H%M%S")
+        out_path = os.path.join(args.out_dir, f"summaries{suffix}-{run_id}.parquet")
+    else:
+        out_path = os.path.join(args.out_dir, f"summaries{suffix}.jsonl")
+    state_path = os.path.join(args.out_dir, f".export_state{suffix}.json")
+    if args.full and os.path.exists(state_path):
+        os.remove(state_path)
+
+    export_summaries(
+        out_path,
+        out_format=args.format,
+        state_path=state_path,
+        start=args.start,
+        end=args.end,
+        workers=args.workers,
+        with_article_text=args.with_article_text,
+        **filters,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import logging
 import azure.functions as func
 from telegram import Update
 from telegram.ext import (
@@ -13,7 +14,21 @@ from summarizer.bot_handlers import (
     summarize_guess,
     report_command,
     disagree_command,
+    history_command,
+    retry_command,
 )
+from summarizer.feeds import read_feeds
+from summarizer.pipeline import run_pipeline
+from summarizer.telemetry import configure_app_insights
+
+# Send traces and metrics to App Insights
+configure_app_insights()
+
+# Feeds summarized on a schedule, so summaries are cached before users ask for them
+PREWARM_FEEDS = ["hackernews", "reddit:news"]
+# Pre-warming runs on the background LLM budget of 3 requests a minute,
+# so only take the top few links of each feed to finish well within functionTimeout.
+PREWARM_URLS_PER_FEED = 4
 
 app = func.FunctionApp()
 
@@ -24,6 +39,8 @@ application.add_handler(CommandHandler("start", start))
 application.add_handler(CommandHandler("help", help_command))
 application.add_handler(CommandHandler("report", report_command))
 application.add_handler(CommandHandler("disagree", disagree_command))
+application.add_handler(CommandHandler("history", history_command))
+application.add_handler(CommandHandler("retry", retry_command))
 # on non command i.e message - echo the message on Telegram
 application.add_handler(
     MessageHandler(filters.TEXT & ~filters.COMMAND, summarize_guess)
@@ -41,3 +58,17 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse("Success")
     except Exception as exc:
         return func.HttpResponse(f"Failure: {exc}", status_code=500)
+
+
+@app.function_name(name="prewarmTimer")
+@app.schedule(schedule="0 0 */4 * * *", arg_name="timer", run_on_startup=False)
+async def prewarm(timer: func.TimerRequest) -> None:
+    """Summarize the front pages of our feeds to pre-warm the summary cache."""
+    urls = await read_feeds(PREWARM_FEEDS, PREWARM_URLS_PER_FEED)
+    # Urls that already have a cached summary are skipped by the pipeline's cache stage
+    results = await run_pipeline(urls, background=True)
+    statuses = [r["status"] for r in results]
+    logging.info(
+        f"Pre-warmed {len(results)} urls. "
+        + ", ".join(f"{s}: {statuses.count(s)}" for s in sorted(set(statuses)))
+    )
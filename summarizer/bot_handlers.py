@@ -1,11 +1,23 @@
 #!/usr/bin/env python
+import asyncio
+import contextlib
 import logging
-import json
 
 from telegram import ForceReply, Update
 from telegram.ext import ContextTypes
-from summarizer.text import get_text
-from summarizer.openai_summarizer import summarize_openai, rebuttal_openai
+from summarizer.text import (
+    get_text,
+    is_valid_url,
+    is_known_failed_domains,
+    canonicalize_url,
+)
+from summarizer.compaction import compact_text
+from summarizer.telemetry import record_cache_lookup, span
+from summarizer.openai_summarizer import (
+    summarize_openai,
+    rebuttal_openai,
+    summary_model,
+)
 from summarizer.database import (
     create_summary,
     is_valid_invite_code,
@@ -13,9 +25,12 @@ from summarizer.database import (
     is_user_authorized,
     create_article,
     read_article,
-    hash_token,
+    read_cached_summary,
+    create_user_history_entry,
+    read_paragraph_summaries,
+    read_user_history,
+    make_summary_value,
 )
-from urllib.parse import urlparse
 
 # Enable logging
 logging.basicConfig(
@@ -62,7 +77,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
     await update.message.reply_text(
-        "Just send me a link and I will summarize it for you."
+        "Just send me a link and I will summarize it for you.\n"
+        "/retry - summarize your last article again\n"
+        "/history - your latest summaries\n"
+        "/disagree <link> - write a rebuttal of an opinion piece"
     )
 
 
@@ -71,9 +89,74 @@ async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.reply_text("🕵️ Reported!")
 
 
+HISTORY_LIMIT = 10
+
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the user's latest summaries when the command /history is issued."""
+    if not check_authorized(update, context):
+        await update.message.reply_text(
+            "You are not authorized to use the summary bot. Use /start to get authorized."
+        )
+        return
+    history = await asyncio.to_thread(
+        read_user_history, update.effective_user.id, HISTORY_LIMIT
+    )
+    if len(history) == 0:
+        await update.message.reply_text("You haven't summarized anything yet.")
+        return
+    lines = [
+        f"{entry['summary_partition_key']} {entry['type']}: {entry['url']}"
+        for entry in history
+    ]
+    await update.message.reply_text(
+        "\n".join(lines),
+        disable_web_page_preview=True,
+    )
+
+
+async def retry_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Summarize the user's last summarized article again, skipping the summary cache."""
+    if not check_authorized(update, context):
+        await update.message.reply_text(
+            "You are not authorized to use the summary bot. Use /start to get authorized."
+        )
+        return
+    history = await asyncio.to_thread(
+        read_user_history, update.effective_user.id, HISTORY_LIMIT
+    )
+    summaries = [
+        entry
+        for entry in history
+        if entry.get("type") in ("bullet_point", "bullet_point_chunked")
+    ]
+    if len(summaries) == 0:
+        await update.message.reply_text(
+            "I couldn't find a recent summary to retry. Send me a link to summarize."
+        )
+        return
+    url = summaries[0]["url"]
+    await update.message.reply_text(
+        f"Summarizing {url} again...",
+        disable_web_page_preview=True,
+    )
+    with span("retry"):
+        await summarize_url(update, url, use_cache=False)
+
+
 async def disagree_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # hack for now
-    url = context.args[0]
+    if len(context.args) == 0:
+        await update.message.reply_text(
+            "Please send a link to disagree with, e.g. /disagree https://example.com/opinion"
+        )
+        return
+    # Canonicalized like summarized links, so the article and paragraph summary caches are shared
+    url = canonicalize_url(context.args[0])
+    with span("disagree"):
+        await rebut_url(update, url)
+
+
+async def rebut_url(update: Update, url: str) -> None:
     text, is_article_from_cache = await get_and_validate_url(update, url)
     if text is None:
         return
@@ -82,17 +165,33 @@ async def disagree_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         f"Got your article from {url}. Thinking about it now...",
         disable_web_page_preview=True,
     )
-    rebuttal_info = await rebuttal_openai(text)
+    paragraph_summaries = None
+    try:
+        with span("cache_lookup_paragraph_summaries"):
+            paragraph_summaries = await asyncio.to_thread(read_paragraph_summaries, url)
+        record_cache_lookup("paragraph_summaries", paragraph_summaries is not None)
+    except Exception as e:
+        logging.error(f"Failed to get paragraph summaries. Falling back. Err: {e}")
+    if paragraph_summaries is None:
+        compacted_text, compaction_info = compact_text(text, url)
+        rebuttal_info = await rebuttal_openai(compacted_text)
+        rebuttal_info["compaction"] = compaction_info
+    else:
+        # The article text is not sent, so there is nothing to compact or to count in the compaction stats
+        rebuttal_info = await rebuttal_openai(text, paragraph_summaries)
     rebuttal = rebuttal_info["rebuttal"]
     logging.info(f"rebuttal: {rebuttal[:50]}")
     await reply_chunked(update, rebuttal)
-    save_rebuttal(
-        rebuttal_info,
-        url,
-        text,
-        update.effective_user.id,
-        is_article_from_cache,
-    )
+    # Several table transactions and a blob upload, so keep them off the event loop
+    with span("save"):
+        await asyncio.to_thread(
+            save_rebuttal,
+            rebuttal_info,
+            url,
+            text,
+            update.effective_user.id,
+            is_article_from_cache,
+        )
 
 
 async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -100,44 +199,13 @@ async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(update.message.text)
 
 
-def is_valid_url(url):
-    try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except ValueError:
-        return False
-
-
-def is_known_failed_domains(url):
-    # Requests to these domains don't seem to work / are not supported yet
-    failed_domains = [
-        "www.reuters.com",
-        "reuters.com",
-        "youtube.com",
-        "twitter.com",
-        "facebook.com",
-        "instagram.com",
-        "pinterest.com",
-        "arxiv.org",
-        "archive.org",
-        "archive.is",
-        "archive.ph",
-        "bloomberg.com",  # Bloomberg has a robots blocker
-        "www.bloomberg.com",  # Bloomberg has a robots blocker
-        "www.ft.com",
-    ]
-    result = urlparse(url)
-    domain = result.netloc
-    return domain in failed_domains
-
-
 async def reply_chunked(update: Update, text: str):
     max_length = 4096
     for i in range(0, len(text), max_length):
         await update.message.reply_text(text[i : i + max_length])
 
 
-async def get_and_validate_url(update: Update, url: str):
+async def get_and_validate_url(update: Update, url: str, fetch_limit=None):
     is_article_from_cache = False
     if not is_valid_url(url):
         await update.message.reply_text(
@@ -153,9 +221,20 @@ async def get_and_validate_url(update: Update, url: str):
         return None, is_article_from_cache
 
     logging.info("Valid URL")
+    if fetch_limit is None:
+        fetch_limit = contextlib.nullcontext()
+    async with fetch_limit:
+        return await fetch_article_text(update, url)
+
+
+async def fetch_article_text(update: Update, url: str):
+    is_article_from_cache = False
     text = None
     try:
-        cached_article = read_article(url)
+        # Storage and network calls are blocking, run them in a thread so that other URLs can proceed concurrently
+        with span("cache_lookup_article"):
+            cached_article = await asyncio.to_thread(read_article, url)
+        record_cache_lookup("article", cached_article is not None)
         if cached_article is not None:
             is_article_from_cache = True
             logging.info("Cache hit for article")
@@ -169,7 +248,7 @@ async def get_and_validate_url(update: Update, url: str):
 
     if text is None:
         try:
-            text = get_text(url)
+            text = await asyncio.to_thread(get_text, url)
             if text is None:
                 await update.message.reply_text(
                     f"Sorry, I couldn't fetch the article from {url}. Sometimes I am blocked from certain domains. Please report this using /report.",
@@ -187,8 +266,42 @@ async def get_and_validate_url(update: Update, url: str):
     return text, is_article_from_cache
 
 
-async def summarize_url(update: Update, url: str) -> None:
-    text, is_article_from_cache = await get_and_validate_url(update, url)
+async def reply_summary(update: Update, url: str, summary: str, tag_with_url: bool):
+    if tag_with_url:
+        await reply_chunked(update, f"{url}\n\n{summary}")
+    else:
+        await reply_chunked(update, summary)
+
+
+async def summarize_url(
+    update: Update, url: str, fetch_limit=None, tag_with_url=False, use_cache=True
+) -> None:
+    if use_cache:
+        cached_summary = None
+        try:
+            with span("cache_lookup_summary"):
+                cached_summary = await asyncio.to_thread(
+                    read_cached_summary, url, summary_model
+                )
+            record_cache_lookup("summary", cached_summary is not None)
+        except Exception as e:
+            logging.error(f"Failed to get summary from cache. Falling back. Err: {e}")
+        if cached_summary is not None:
+            logging.info("Cache hit for summary")
+            await reply_summary(update, url, cached_summary["summary"], tag_with_url)
+            # So that /history and /retry know about summaries served from the cache
+            try:
+                with span("save"):
+                    await asyncio.to_thread(
+                        create_user_history_entry,
+                        cached_summary,
+                        update.effective_user.id,
+                    )
+            except Exception as e:
+                logging.error(f"Failed to save user history. Err: {e}")
+            return
+
+    text, is_article_from_cache = await get_and_validate_url(update, url, fetch_limit)
     if text is None:
         return
 
@@ -196,17 +309,22 @@ async def summarize_url(update: Update, url: str) -> None:
         f"Got your article from {url}. Summarizing it now...",
         disable_web_page_preview=True,
     )
-    summary_info = await summarize_openai(text)
+    compacted_text, compaction_info = compact_text(text, url)
+    summary_info = await summarize_openai(compacted_text)
+    summary_info["compaction"] = compaction_info
     summary = summary_info["summary"]
     logging.info(f"summary: {summary[:50]}")
-    await reply_chunked(update, summary)
-    save_summary(
-        summary_info,
-        url,
-        text,
-        update.effective_user.id,
-        is_article_from_cache,
-    )
+    await reply_summary(update, url, summary, tag_with_url)
+    # Several table transactions and a blob upload, so keep them off the event loop
+    with span("save"):
+        await asyncio.to_thread(
+            save_summary,
+            summary_info,
+            url,
+            text,
+            update.effective_user.id,
+            is_article_from_cache,
+        )
 
 
 def check_authorized(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -218,10 +336,42 @@ import re
 
 naive_url_regex = re.compile(r"https?://\S+")
 
+MAX_URLS_PER_MESSAGE = 10
+# Fetching and extracting is done concurrently for messages with many URLs.
+# The LLM requests are still limited by the shared rate limiter in openai_summarizer.
+MAX_CONCURRENT_FETCHES_PER_MESSAGE = 3
+
+
+def find_urls(message: str) -> list[str]:
+    # Links pasted as a list are often separated by commas or end a sentence
+    urls = [
+        canonicalize_url(url.rstrip(".,;"))
+        for url in naive_url_regex.findall(message)
+    ]
+    # Deduplicate while keeping the order
+    return list(dict.fromkeys(urls))
+
+
+async def summarize_url_safely(update: Update, url: str, fetch_limit) -> None:
+    try:
+        await summarize_url(update, url, fetch_limit, tag_with_url=True)
+    except Exception as e:
+        logging.error(f"Error summarizing {url}: {e}")
+        await update.message.reply_text(
+            f"Sorry, something went wrong summarizing {url}. Please try again later.",
+            disable_web_page_preview=True,
+        )
+
 
 async def summarize_guess(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Summarize the user's message. The user's message should contain an article URL, if not reject"""
-    is_authorized = check_authorized(update, context)
+    with span("summarize_message"):
+        await summarize_message(update, context)
+
+
+async def summarize_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    with span("auth"):
+        is_authorized = check_authorized(update, context)
     if not is_authorized:
         await update.message.reply_text(
             "You are not authorized to use the summary bot. Use /start to get authorized."
@@ -229,36 +379,33 @@ async def summarize_guess(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     user_message = update.message.text
     logging.info(f"Received user message to summarize: {user_message}")
-    match = naive_url_regex.search(user_message)
-    if not match:
+    urls = find_urls(user_message)
+    if len(urls) == 0:
         await update.message.reply_text(
             "Could not find a URL in your message to summarize."
         )
         return
-    user_message = match.group(0)
-    await summarize_url(update, user_message)
+    if len(urls) == 1:
+        await summarize_url(update, urls[0])
+        return
+
+    if len(urls) > MAX_URLS_PER_MESSAGE:
+        await update.message.reply_text(
+            f"Your message has {len(urls)} links. I will only summarize the first {MAX_URLS_PER_MESSAGE}."
+        )
+        urls = urls[:MAX_URLS_PER_MESSAGE]
+    # Each URL replies with its own summary as soon as it is done, so they arrive in order of completion
+    fetch_limit = asyncio.Semaphore(MAX_CONCURRENT_FETCHES_PER_MESSAGE)
+    await asyncio.gather(
+        *[summarize_url_safely(update, url, fetch_limit) for url in urls]
+    )
 
 
 AZURE_TABLE_STORAGE_MAX_FIELD_SIZE = 32_000
 
 
 def save_summary(summary_info, url, text, user_id, is_article_from_cache):
-    summary = summary_info["summary"]
-
-    url_hashed = hash_token(url)
-    value = {
-        "url": url,
-        "summary_model": summary_info["model"],
-        "summary": summary,
-        "user_id": user_id,
-        "source": "telegram",
-        "type": summary_info["type"],
-        "is_text_in_blob": True,
-        "url_hashed": url_hashed,
-    }
-    if summary_info["type"] == "bullet_point_chunked":
-        value["paragraph_summaries"] = json.dumps(summary_info["paragraph_summaries"])
-    create_summary(value)
+    create_summary(make_summary_value(summary_info, url, "telegram", user_id))
     if is_article_from_cache:
         logging.info("Article was from cache, not saving it again")
     else:
@@ -267,22 +414,7 @@ def save_summary(summary_info, url, text, user_id, is_article_from_cache):
 
 
 def save_rebuttal(rebuttal_info, url, text, user_id, is_article_from_cache):
-    rebuttal = rebuttal_info["rebuttal"]
-
-    url_hashed = hash_token(url)
-    value = {
-        "url": url,
-        "rebuttal_model": rebuttal_info["model"],
-        "rebuttal": rebuttal,
-        "user_id": user_id,
-        "source": "telegram",
-        "type": rebuttal_info["type"],
-        "is_text_in_blob": True,
-        "url_hashed": url_hashed,
-    }
-    if rebuttal_info["type"] == "bullet_point_chunked":
-        value["paragraph_summaries"] = json.dumps(rebuttal_info["paragraph_summaries"])
-    create_summary(value)
+    create_summary(make_summary_value(rebuttal_info, url, "telegram", user_id))
     if is_article_from_cache:
         logging.info("Article was from cache, not saving it again")
     else:
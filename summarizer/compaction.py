@@ -0,0 +1,194 @@
+import logging
+import re
+from urllib.parse import urlparse
+
+from .telemetry import compaction_tokens, span
+from .text import APPROX_CHARS_PER_TOKEN
+
+# Paragraphs whose word shingles are mostly contained in an earlier paragraph are treated as duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 3
+# Short lines such as "Advertisement" are only dropped if they match a boilerplate pattern,
+# so we don't throw away short but meaningful paragraphs like headings.
+MIN_PARAGRAPH_LENGTH_FOR_NEAR_DUPLICATE = 40
+
+# Boilerplate blurbs are short. Longer paragraphs are always kept, even if they start like a blurb.
+MAX_BOILERPLATE_LENGTH = 200
+
+# Boilerplate that shows up across many sites. Each pattern must match the whole paragraph,
+# and starts with the trigger phrase so that article sentences mentioning it are kept.
+COMMON_BOILERPLATE_PATTERNS = [
+    r"advertisement",
+    r"(sponsored|promoted) content",
+    r"(sign up|subscribe)( now)? (for|to) (our|the) .*newsletter.*",
+    r"(click|tap) here (to|for) [^.!]{0,60}[.!]?",
+    r"read more",
+    r"(also )?read( more)?: .*",
+    r"related( stories| articles)?: .*",
+    r"share (this )?(article|story|page)[.!]?",
+    r"share on (facebook|twitter|x|whatsapp|linkedin|email)[.!]?",
+    r"follow us on .*",
+    r"(image|photo|picture|video)( credit)?:.*",
+    r"(photograph|photo|image|illustration): .*",
+    r"(©|copyright) .*all rights reserved.*",
+    r"we use cookies.*",
+    r"this article (was )?(originally )?(appeared|published) .*",
+    r"(get|download) (the|our) app.*",
+]
+
+# Extra boilerplate for specific domains. Keys are the netloc without "www.".
+DOMAIN_BOILERPLATE_PATTERNS = {
+    "straitstimes.com": [
+        r"join st's telegram channel.*",
+        r"sign up for the st .*",
+    ],
+    "mothership.sg": [
+        r"follow and listen to our podcast.*",
+        r"top photo .*",
+    ],
+    "theguardian.com": [
+        r"support the guardian.*",
+        r"sign up to .*",
+    ],
+    "cnn.com": [
+        r"sign up for cnn's .*",
+    ],
+    "nytimes.com": [
+        r"supported by",
+        r"(a|an) .*version of this article appears in print.*",
+    ],
+    "washingtonpost.com": [
+        r"(comment|gift article|share)",
+    ],
+    "channelnewsasia.com": [
+        r"download our app or subscribe to our telegram channel.*",
+    ],
+}
+
+_common_boilerplate = [re.compile(p, re.IGNORECASE) for p in COMMON_BOILERPLATE_PATTERNS]
+_domain_boilerplate = {
+    domain: [re.compile(p, re.IGNORECASE) for p in patterns]
+    for domain, patterns in DOMAIN_BOILERPLATE_PATTERNS.items()
+}
+# Image credits at the end of a paragraph, e.g. "... on Tuesday. (Photo: Reuters)". Only the credit is removed.
+_trailing_caption_regex = re.compile(
+    r"\s*\((photo|image|illustration|picture)s?( credit)?: [^)]*\)\s*$", re.IGNORECASE
+)
+_non_word_regex = re.compile(r"[^\w\s]")
+_whitespace_regex = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // APPROX_CHARS_PER_TOKEN
+
+
+def get_domain(url: str | None) -> str | None:
+    if not url:
+        return None
+    netloc = urlparse(url).netloc.lower()
+    return netloc.removeprefix("www.")
+
+
+def boilerplate_patterns_for(url: str | None) -> list:
+    domain = get_domain(url)
+    if domain is None:
+        return _common_boilerplate
+    # Match subdomains too, e.g. edition.cnn.com
+    domain_patterns = [
+        pattern
+        for key, patterns in _domain_boilerplate.items()
+        if domain == key or domain.endswith("." + key)
+        for pattern in patterns
+    ]
+    return _common_boilerplate + domain_patterns
+
+
+def normalize_paragraph(paragraph: str) -> str:
+    lowered = _non_word_regex.sub("", paragraph.lower())
+    return _whitespace_regex.sub(" ", lowered).strip()
+
+
+def shingles(normalized: str) -> set:
+    words = normalized.split(" ")
+    if len(words) < SHINGLE_SIZE:
+        return {normalized}
+    return {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def is_boilerplate(paragraph: str, patterns: list) -> bool:
+    stripped = paragraph.strip()
+    if len(stripped) > MAX_BOILERPLATE_LENGTH:
+        return False
+    return any(pattern.fullmatch(stripped) for pattern in patterns)
+
+
+def compact_text(text: str, url: str | None = None) -> tuple[str, dict]:
+    """
+    Removes boilerplate, exact duplicate and near duplicate paragraphs from extracted article text.
+    Returns the compacted text and a dict of stats on how many tokens were saved.
+    """
+    with span("compact"):
+        compacted, removed_boilerplate, removed_duplicates = remove_paragraphs(text, url)
+    compaction_info = {
+        "tokens_before": estimate_tokens(text),
+        "tokens_after": estimate_tokens(compacted),
+        "removed_boilerplate": removed_boilerplate,
+        "removed_duplicates": removed_duplicates,
+    }
+    logging.info(
+        f"Compacted text from {compaction_info['tokens_before']} to {compaction_info['tokens_after']} tokens. "
+        f"Removed {removed_boilerplate} boilerplate and {removed_duplicates} duplicate paragraphs."
+    )
+    compaction_tokens.inc(compaction_info["tokens_before"], kind="before")
+    compaction_tokens.inc(compaction_info["tokens_after"], kind="after")
+    return compacted, compaction_info
+
+
+def remove_paragraphs(text: str, url: str | None) -> tuple[str, int, int]:
+    patterns = boilerplate_patterns_for(url)
+    seen_exact = set()
+    # Shingles of every paragraph we kept, for near duplicate detection
+    kept_shingles = []
+    kept = []
+    removed_boilerplate = 0
+    removed_duplicates = 0
+
+    for paragraph in text.split("\n"):
+        paragraph = _trailing_caption_regex.sub("", paragraph)
+        if paragraph.strip() == "":
+            continue
+        if is_boilerplate(paragraph, patterns):
+            removed_boilerplate += 1
+            continue
+
+        normalized = normalize_paragraph(paragraph)
+        if normalized in seen_exact:
+            removed_duplicates += 1
+            continue
+        seen_exact.add(normalized)
+
+        if len(normalized) >= MIN_PARAGRAPH_LENGTH_FOR_NEAR_DUPLICATE:
+            paragraph_shingles = shingles(normalized)
+            if is_near_duplicate(paragraph_shingles, kept_shingles):
+                removed_duplicates += 1
+                continue
+            kept_shingles.append(paragraph_shingles)
+        kept.append(paragraph)
+
+    return "\n".join(kept), removed_boilerplate, removed_duplicates
+
+
+def is_near_duplicate(paragraph_shingles: set, kept_shingles: list) -> bool:
+    # We check containment rather than Jaccard similarity, so that pull-quotes
+    # repeating part of an earlier paragraph are also caught.
+    size = len(paragraph_shingles)
+    for other in kept_shingles:
+        if len(other) < NEAR_DUPLICATE_THRESHOLD * size:
+            continue
+        contained = len(paragraph_shingles & other)
+        if contained / size >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
@@ -1,9 +1,11 @@
 import logging
 import os
 import hashlib
+import itertools
 import json
-from datetime import datetime
-from azure.data.tables import TableServiceClient
+from datetime import datetime, timezone
+from uuid import uuid4
+from azure.data.tables import EntityProperty, TableServiceClient
 from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
 from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
 
@@ -36,11 +38,20 @@ blob_service_client: BlobServiceClient = init_blob_service_client(
     blob_connection_string
 )
 summaries_table_client = None
+summaries_by_url_table_client = None
+summaries_by_user_table_client = None
 users_table_client = None
 invite_codes_table_client = None
 articles_container_client = None
 if table_service_client is not None:
     summaries_table_client = table_service_client.get_table_client("summaries")
+    # Index tables, so summaries can be looked up by url or user without scanning the summaries table
+    summaries_by_url_table_client = table_service_client.get_table_client(
+        "summariesbyurl"
+    )
+    summaries_by_user_table_client = table_service_client.get_table_client(
+        "summariesbyuser"
+    )
     users_table_client = table_service_client.get_table_client("users")
     invite_codes_table_client = table_service_client.get_table_client("invitecodes")
     articles_container_client = blob_service_client.get_container_client("articles")
@@ -87,20 +98,245 @@ def read_article(url: str):
         raise
 
 
-def create_summary(value: dict):
+# Reverse timestamps sort the newest rows first, since table queries return rows in RowKey order
+MAX_TIMESTAMP_MICROSECONDS = 10**18
+# Transactions are limited to 100 operations and 4MB of payload
+MAX_TRANSACTION_OPERATIONS = 100
+MAX_TRANSACTION_BYTES = 3_500_000
+# Paragraph summaries are large and only needed when looking up by url
+FIELDS_NOT_IN_USER_INDEX = ["paragraph_summaries"]
+
+
+def reverse_timestamp(now: datetime) -> str:
+    # Naive datetimes are the wall-clock time also used in the summaries table keys. They are read as UTC rather
+    # than the local timezone, so the bot and a backfill on another machine compute the same index row key.
+    if now.tzinfo is None:
+        now = now.replace(tzinfo=timezone.utc)
+    microseconds = int(now.timestamp()) * 1_000_000 + now.microsecond
+    return f"{MAX_TIMESTAMP_MICROSECONDS - microseconds:019d}"
+
+
+def make_summary_value(
+    info: dict, url: str, source: str, user_id: int | None = None
+) -> dict:
+    """
+    Builds the summaries table row of a summary or rebuttal, from the info returned by
+    summarize_openai or rebuttal_openai. Rows without a user_id are not added to the user index.
+    """
+    kind = "rebuttal" if "rebuttal" in info else "summary"
+    value = {
+        "url": url,
+        f"{kind}_model": info["model"],
+        kind: info[kind],
+        "source": source,
+        "type": info["type"],
+        "is_text_in_blob": True,
+        "url_hashed": hash_token(url),
+    }
+    if user_id is not None:
+        value["user_id"] = user_id
+    if "paragraph_summaries" in info:
+        value["paragraph_summaries"] = json.dumps(info["paragraph_summaries"])
+    # Record how many tokens compaction saved, so we can measure it across summaries
+    if "compaction" in info:
+        value["tokens_before_compaction"] = info["compaction"]["tokens_before"]
+        value["tokens_after_compaction"] = info["compaction"]["tokens_after"]
+    return value
+
+
+def make_summary_entities(value: dict, now: datetime) -> tuple[dict, dict, dict | None]:
+    """Returns the summary entity and its url and user index entities"""
+    # A random suffix so that two summaries in the same microsecond don't collide
+    unique = uuid4().hex[:8]
+    summary = dict(value)
+    # YYYY-MM-DD as a partition key
+    summary["PartitionKey"] = now.strftime("%Y-%m-%d")
+    ## HH:MM:SS:ms as a row key
+    summary["RowKey"] = now.strftime("%H:%M:%S:%f") + "-" + unique
+
+    index_row_key = reverse_timestamp(now) + "-" + unique
+    index_value = {
+        **value,
+        "summary_partition_key": summary["PartitionKey"],
+        "summary_row_key": summary["RowKey"],
+    }
+    by_url = {
+        **index_value,
+        "PartitionKey": value["url_hashed"],
+        "RowKey": index_row_key,
+    }
+    by_user = None
+    if value.get("user_id") is not None:
+        by_user = {
+            key: field
+            for key, field in index_value.items()
+            if key not in FIELDS_NOT_IN_USER_INDEX
+        }
+        by_user["PartitionKey"] = str(value["user_id"])
+        by_user["RowKey"] = index_row_key
+    return summary, by_url, by_user
+
+
+def submit_batched(table_client, entities: list[dict]):
+    """Upserts the entities in as few transactions as possible. Transactions can only span one partition."""
+    by_partition = {}
+    for entity in entities:
+        by_partition.setdefault(entity["PartitionKey"], []).append(entity)
+    for partition_entities in by_partition.values():
+        operations = []
+        size = 0
+        for entity in partition_entities:
+            entity_size = len(json.dumps(entity, default=str))
+            if len(operations) > 0 and (
+                len(operations) >= MAX_TRANSACTION_OPERATIONS
+                or size + entity_size > MAX_TRANSACTION_BYTES
+            ):
+                table_client.submit_transaction(operations)
+                operations = []
+                size = 0
+            operations.append(("upsert", entity))
+            size += entity_size
+        table_client.submit_transaction(operations)
+
+
+def create_summaries(values: list[dict]):
+    """
+    Saves the summaries and their index rows. Rows of the same partition are written in one transaction,
+    so saving many summaries of one day together takes a single write to the summaries table.
+    """
     if summaries_table_client is None:
         logging.error("No summaries table client found")
         return
-    # YYYY-MM-DD as a partition key
-    now = datetime.now()
-    partition_key = now.strftime("%Y-%m-%d")
-    ## HH:MM:SS:ms as a row key
-    row_key = now.strftime("%H:%M:%S:%f")
+    summaries = []
+    by_url = []
+    by_user = []
+    for value in values:
+        summary, url_entity, user_entity = make_summary_entities(value, datetime.now())
+        summaries.append(summary)
+        by_url.append(url_entity)
+        if user_entity is not None:
+            by_user.append(user_entity)
+
+    submit_batched(summaries_table_client, summaries)
+    # The summaries are saved, so a failed index write only means slower lookups for now
+    try:
+        submit_batched(summaries_by_url_table_client, by_url)
+        submit_batched(summaries_by_user_table_client, by_user)
+    except Exception as e:
+        logging.error(f"Failed to write summary indexes: {e}")
+
+
+def create_summary(value: dict):
+    create_summaries([value])
 
-    value["PartitionKey"] = partition_key
-    value["RowKey"] = row_key
 
-    summaries_table_client.create_entity(entity=value)
+def create_user_history_entry(summary: dict, user_id: int):
+    """Records in the user's history that they were sent an existing summary, e.g. from the cache"""
+    if summaries_by_user_table_client is None:
+        logging.error("No summaries by user table client found")
+        return
+    value = {
+        key: field
+        for key, field in summary.items()
+        if key not in FIELDS_NOT_IN_USER_INDEX + ["PartitionKey", "RowKey"]
+    }
+    value["user_id"] = user_id
+    value["source"] = "cache"
+    value["PartitionKey"] = str(user_id)
+    value["RowKey"] = reverse_timestamp(datetime.now()) + "-" + uuid4().hex[:8]
+    summaries_by_user_table_client.upsert_entity(entity=value)
+
+
+def read_summaries_for_url(
+    url: str, summary_type: str | None = None, limit: int | None = None
+) -> list:
+    """Returns the summaries of this url, newest first"""
+    if summaries_by_url_table_client is None:
+        logging.error("No summaries by url table client found")
+        return []
+    query_filter = "PartitionKey eq @url_hashed"
+    parameters = {"url_hashed": hash_token(url)}
+    if summary_type is not None:
+        query_filter += " and type eq @type"
+        parameters["type"] = summary_type
+    entities = summaries_by_url_table_client.query_entities(
+        query_filter=query_filter, parameters=parameters, results_per_page=limit
+    )
+    return list(itertools.islice(entities, limit))
+
+
+def read_user_history(user_id: int, limit: int = 10) -> list:
+    """Returns the user's latest summaries and rebuttals, newest first"""
+    if summaries_by_user_table_client is None:
+        logging.error("No summaries by user table client found")
+        return []
+    entities = summaries_by_user_table_client.query_entities(
+        query_filter="PartitionKey eq @user_id",
+        parameters={"user_id": str(user_id)},
+        results_per_page=limit,
+    )
+    return list(itertools.islice(entities, limit))
+
+
+def read_cached_summary(url: str, model: str) -> dict | None:
+    """Returns the latest bullet point summary of this url made by the given model, if any"""
+    for summary in read_summaries_for_url(url):
+        if (
+            summary.get("type") in ("bullet_point", "bullet_point_chunked")
+            and summary.get("summary_model") == model
+        ):
+            return summary
+    return None
+
+
+def read_paragraph_summaries(url: str) -> list[str] | None:
+    """Returns the paragraph summaries of the latest chunked summary or rebuttal of this url, if any"""
+    for summary in read_summaries_for_url(url):
+        if "paragraph_summaries" in summary:
+            return json.loads(summary["paragraph_summaries"])
+    return None
+
+
+def backfill_summary_indexes(partition_key: str) -> int:
+    """Writes index rows for summaries saved before the index tables existed. Returns the number of summaries."""
+    if summaries_table_client is None:
+        logging.error("No summaries table client found")
+        return 0
+    entities = summaries_table_client.query_entities(
+        query_filter="PartitionKey eq @partition_key",
+        parameters={"partition_key": partition_key},
+    )
+    by_url = []
+    by_user = []
+    for entity in entities:
+        value = {
+            key: field.value if isinstance(field, EntityProperty) else field
+            for key, field in entity.items()
+        }
+        del value["PartitionKey"]
+        del value["RowKey"]
+        if "url_hashed" not in value:
+            continue
+        # Old row keys don't have the random suffix
+        time_part, _, unique = entity["RowKey"].partition("-")
+        now = datetime.strptime(
+            f"{partition_key} {time_part}", "%Y-%m-%d %H:%M:%S:%f"
+        )
+        _, url_entity, user_entity = make_summary_entities(value, now)
+        # Keep pointing at the existing summary row, and keep the index row key stable across reruns
+        row_key = reverse_timestamp(now) + "-" + (unique or "0")
+        for index_entity in (url_entity, user_entity):
+            if index_entity is None:
+                continue
+            index_entity["summary_partition_key"] = entity["PartitionKey"]
+            index_entity["summary_row_key"] = entity["RowKey"]
+            index_entity["RowKey"] = row_key
+        by_url.append(url_entity)
+        if user_entity is not None:
+            by_user.append(user_entity)
+    submit_batched(summaries_by_url_table_client, by_url)
+    submit_batched(summaries_by_user_table_client, by_user)
+    return len(by_url)
 
 
 def create_user(user_id: int, invite_code: str, user_fullname: str) -> bool:
@@ -0,0 +1,345 @@
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from azure.data.tables import EntityProperty
+
+from .database import read_article, summaries_table_client
+
+# Summaries are partitioned by day, starting from when the bot went live
+FIRST_PARTITION_DATE = date(2024, 2, 1)
+PAGE_SIZE = 1000
+# Rows buffered between the partition readers and the writer. This bounds memory use.
+MAX_BUFFERED_ROWS = 4 * PAGE_SIZE
+DEFAULT_PARTITION_WORKERS = 8
+# How often a reader blocked on a full queue checks whether the export was stopped
+PUT_TIMEOUT_SECONDS = 0.5
+
+# Columns written to Parquet. JSONL rows keep whatever properties the entity has.
+PARQUET_COLUMNS = {
+    "PartitionKey": "string",
+    "RowKey": "string",
+    "Timestamp": "timestamp",
+    "url": "string",
+    "url_hashed": "string",
+    "type": "string",
+    "source": "string",
+    "user_id": "int64",
+    "summary_model": "string",
+    "summary": "string",
+    "rebuttal_model": "string",
+    "rebuttal": "string",
+    "paragraph_summaries": "string",
+    "tokens_before_compaction": "int64",
+    "tokens_after_compaction": "int64",
+    "article_text": "string",
+}
+
+# The service keeps 7 fractional digits (100ns ticks), e.g. 2024-03-01T12:00:00.1234567Z
+_service_timestamp_regex = re.compile(
+    r"(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d{1,7}))?Z"
+)
+_done = object()
+
+
+def build_query_filter(
+    partition_key: str,
+    since: str | None = None,
+    summary_type: str | None = None,
+    model: str | None = None,
+    user_id: int | None = None,
+) -> tuple[str, dict]:
+    # Note: the SDK substitutes parameters word by word, so every @param must be surrounded by spaces
+    clauses = ["PartitionKey eq @partition_key"]
+    parameters = {"partition_key": partition_key}
+    if since is not None:
+        # Not a parameter, since the SDK would truncate it to microseconds and the last row would match again
+        if not _service_timestamp_regex.fullmatch(since):
+            raise ValueError(f"Invalid high-water mark {since}")
+        clauses.append(f"Timestamp gt datetime'{since}'")
+    if summary_type is not None:
+        clauses.append("type eq @type")
+        parameters["type"] = summary_type
+    if model is not None:
+        clauses.append("( summary_model eq @model or rebuttal_model eq @model )")
+        parameters["model"] = model
+    if user_id is not None:
+        clauses.append("user_id eq @user_id")
+        parameters["user_id"] = user_id
+    return " and ".join(clauses), parameters
+
+
+def partition_keys(start: date, end: date) -> list[str]:
+    days = (end - start).days
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days + 1)]
+
+
+def service_timestamp(entity) -> str | None:
+    """The entity's Timestamp as the service sent it, with full precision"""
+    timestamp = entity.metadata.get("timestamp")
+    if timestamp is None:
+        return None
+    if timestamp.tables_service_value:
+        return timestamp.tables_service_value
+    return timestamp.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f0Z")
+
+
+def timestamp_ticks(timestamp: str) -> int:
+    """Converts a service timestamp to 100ns ticks, so timestamps with different precision compare correctly"""
+    match = _service_timestamp_regex.fullmatch(timestamp)
+    seconds = datetime.strptime(match.group(1), "%Y-%m-%dT%H:%M:%S")
+    fraction = (match.group(2) or "").ljust(7, "0")
+    return int(seconds.replace(tzinfo=timezone.utc).timestamp()) * 10**7 + int(fraction)
+
+
+def entity_to_row(entity) -> dict:
+    row = {}
+    for key, value in entity.items():
+        # Large ints such as telegram user ids come back wrapped in an EntityProperty
+        if isinstance(value, EntityProperty):
+            value = value.value
+        row[key] = value
+    row["Timestamp"] = entity.metadata.get("timestamp")
+    return row
+
+
+def add_article_text(row: dict):
+    # Long articles were summarized in chunks, and their text lives in blob storage
+    if "paragraph_summaries" not in row or not row.get("is_text_in_blob"):
+        return
+    try:
+        article = read_article(row["url"])
+    except Exception as e:
+        logging.error(f"Could not read article for {row['url']}: {e}")
+        return
+    if article is not None:
+        row["article_text"] = article.get("text")
+
+
+def put_unless_stopped(rows: queue.Queue, item, stop: threading.Event) -> bool:
+    """Puts the item on the queue, waiting while it is full. Returns False if stop was set first."""
+    while not stop.is_set():
+        try:
+            rows.put(item, timeout=PUT_TIMEOUT_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_partition(
+    partition_key: str,
+    rows: queue.Queue,
+    stop: threading.Event,
+    with_article_text: bool,
+    **filters,
+):
+    """
+    Reads one partition page by page, following continuation tokens, and puts each row on the queue.
+    Returns early once stop is set, e.g. because the writer failed.
+    """
+    if stop.is_set():
+        return
+    query_filter, parameters = build_query_filter(partition_key, **filters)
+    # by_page fetches one page per request, following the continuation token of the previous page
+    pages = summaries_table_client.query_entities(
+        query_filter=query_filter,
+        parameters=parameters,
+        results_per_page=PAGE_SIZE,
+    ).by_page()
+    count = 0
+    for page in pages:
+        for entity in page:
+            row = entity_to_row(entity)
+            if with_article_text:
+                add_article_text(row)
+            # Blocks while the writer catches up
+            if not put_unless_stopped(rows, (row, service_timestamp(entity)), stop):
+                return
+            count += 1
+    if count > 0:
+        logging.info(f"Exported {count} rows from partition {partition_key}")
+
+
+def stream_rows(
+    start: date,
+    end: date,
+    workers: int = DEFAULT_PARTITION_WORKERS,
+    with_article_text: bool = False,
+    **filters,
+):
+    """Yields (row, service timestamp) of all partitions between start and end, reading partitions in parallel"""
+    rows = queue.Queue(maxsize=MAX_BUFFERED_ROWS)
+    stop = threading.Event()
+    errors = []
+
+    def read_all():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    read_partition, key, rows, stop, with_article_text, **filters
+                )
+                for key in partition_keys(start, end)
+            ]
+            for future in futures:
+                exception = future.exception()
+                if exception is not None:
+                    errors.append(exception)
+        put_unless_stopped(rows, _done, stop)
+
+    reader = threading.Thread(target=read_all, daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = rows.get()
+            if item is _done:
+                break
+            yield item
+    finally:
+        # If the consumer failed or stopped early, the readers may be blocked on the full queue.
+        # Tell them to stop and unblock them, otherwise the executor's threads keep the process alive.
+        stop.set()
+        while True:
+            try:
+                rows.get_nowait()
+            except queue.Empty:
+                break
+    reader.join()
+    if len(errors) > 0:
+        raise errors[0]
+
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "w")
+
+    def write(self, row: dict):
+        self.file.write(json.dumps(row, default=str) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow, run: pip install pyarrow")
+        types = {
+            "string": pa.string(),
+            "int64": pa.int64(),
+            "timestamp": pa.timestamp("us", tz="UTC"),
+        }
+        self.pa = pa
+        self.schema = pa.schema(
+            [(name, types[kind]) for name, kind in PARQUET_COLUMNS.items()]
+        )
+        # Parquet files can't be appended to, so each run writes its own file
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.batch = []
+
+    def write(self, row: dict):
+        self.batch.append(row)
+        if len(self.batch) >= PAGE_SIZE:
+            self.flush()
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+        columns = {name: [row.get(name) for row in self.batch] for name in PARQUET_COLUMNS}
+        table = self.pa.Table.from_pydict(columns, schema=self.schema)
+        self.writer.write_table(table)
+        self.batch = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def read_high_water_mark(state_path: str) -> str | None:
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as file:
+        state = json.load(file)
+    return state["timestamp"]
+
+
+def write_high_water_mark(state_path: str, timestamp: str):
+    with open(state_path, "w") as file:
+        json.dump({"timestamp": timestamp}, file)
+
+
+def export_summaries(
+    out_path: str,
+    out_format: str = "jsonl",
+    state_path: str | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    workers: int = DEFAULT_PARTITION_WORKERS,
+    with_article_text: bool = False,
+    **filters,
+) -> int:
+    """
+    Exports the summaries table to JSONL or Parquet, streaming rows so memory use stays constant.
+    If state_path is given, only rows newer than the last export are fetched and appended to a JSONL
+    out_path, and the high-water mark is updated once the export succeeds. Without a high-water mark,
+    out_path is replaced. Returns the number of rows exported.
+    """
+    if summaries_table_client is None:
+        logging.error("No summaries table client found")
+        return 0
+
+    since = read_high_water_mark(state_path) if state_path else None
+    if start is None:
+        if since is not None:
+            # Partition keys are local dates and Timestamp is UTC, so go back a day to be safe
+            start = date.fromisoformat(since[:10]) - timedelta(days=1)
+        else:
+            start = FIRST_PARTITION_DATE
+    # Same for the end, the local date may be ahead of UTC
+    end = end or datetime.now(timezone.utc).date() + timedelta(days=1)
+    logging.info(f"Exporting partitions {start} to {end}, rows newer than {since}")
+
+    # Write to a temporary file first, so a failed run doesn't leave partial output behind
+    tmp_path = out_path + ".tmp"
+    writer = ParquetWriter(tmp_path) if out_format == "parquet" else JsonlWriter(tmp_path)
+    count = 0
+    high_water_mark = since
+    try:
+        for row, timestamp in stream_rows(
+            start, end, workers, with_article_text, since=since, **filters
+        ):
+            writer.write(row)
+            count += 1
+            if timestamp is not None and (
+                high_water_mark is None
+                or timestamp_ticks(timestamp) > timestamp_ticks(high_water_mark)
+            ):
+                high_water_mark = timestamp
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(tmp_path)
+        raise
+
+    if out_format == "parquet" or since is None:
+        # Without a high-water mark this is a full export, so it replaces any earlier JSONL file
+        os.replace(tmp_path, out_path)
+    else:
+        # Incremental exports build up one JSONL file
+        with open(tmp_path) as src, open(out_path, "a") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(tmp_path)
+
+    if state_path and high_water_mark is not None:
+        write_high_water_mark(state_path, high_water_mark)
+    logging.info(f"Exported {count} rows to {out_path}")
+    return count
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+import httpx
+
+HACKERNEWS_API_URL = "https://hacker-news.firebaseio.com/v0"
+REDDIT_URL = "https://www.reddit.com"
+# Reddit rejects requests with the default httpx user agent
+USER_AGENT = "url-summarizer-telegram-bot/1.0"
+FEED_TIMEOUT_SECONDS = 10
+
+
+def read_file_feed(path: str, limit: int | None = None) -> list[str]:
+    """Reads one URL per line, ignoring blank lines and lines starting with #"""
+    urls = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            urls.append(line)
+    return urls[:limit]
+
+
+async def read_hackernews_front_page(limit: int = 30) -> list[str]:
+    async with httpx.AsyncClient(timeout=FEED_TIMEOUT_SECONDS) as client:
+        response = await client.get(f"{HACKERNEWS_API_URL}/topstories.json")
+        response.raise_for_status()
+        story_ids = response.json()[:limit]
+
+        async def read_story_url(story_id):
+            response = await client.get(f"{HACKERNEWS_API_URL}/item/{story_id}.json")
+            response.raise_for_status()
+            # Ask HN and other text posts don't have a url
+            return response.json().get("url")
+
+        urls = await asyncio.gather(*[read_story_url(i) for i in story_ids])
+    return [url for url in urls if url is not None]
+
+
+async def read_reddit_top(subreddit: str = "news", limit: int = 10) -> list[str]:
+    async with httpx.AsyncClient(
+        timeout=FEED_TIMEOUT_SECONDS, headers={"User-Agent": USER_AGENT}
+    ) as client:
+        response = await client.get(
+            f"{REDDIT_URL}/r/{subreddit}/top.json",
+            params={"limit": limit, "t": "day"},
+        )
+        response.raise_for_status()
+        posts = response.json()["data"]["children"]
+    return [post["data"]["url"] for post in posts if not post["data"].get("is_self")]
+
+
+async def read_feed(feed: str, limit: int | None = None) -> list[str]:
+    """
+    Reads the URLs of a feed. Feeds are given as:
+      hackernews         - Hacker News front page
+      reddit:<subreddit> - top posts of the day on a subreddit, e.g. reddit:news
+      file:<path>        - a local file with one URL per line
+    """
+    kind, _, arg = feed.partition(":")
+    if kind == "hackernews":
+        return await read_hackernews_front_page(limit or 30)
+    if kind == "reddit":
+        return await read_reddit_top(arg or "news", limit or 10)
+    if kind == "file":
+        return read_file_feed(arg, limit)
+    raise ValueError(f"Unknown feed {feed}")
+
+
+async def read_feeds(feeds: list[str], limit: int | None = None) -> list[str]:
+    urls = []
+    for feed in feeds:
+        try:
+            feed_urls = await read_feed(feed, limit)
+        except Exception as e:
+            logging.error(f"Failed to read feed {feed}: {e}")
+            continue
+        logging.info(f"Read {len(feed_urls)} urls from {feed}")
+        urls.extend(feed_urls)
+    return urls
@@ -0,0 +1,121 @@
+"""
+A local OpenAI compatible chat completions server, for testing and benchmarking without calling Lepton.
+Point the summarizer at it with LLM_BASE_URL=http://127.0.0.1:8080/v1/ and any LEPTON_API_KEY.
+
+    python -m summarizer.mock_llm --port 8080 --latency 0.5 --tokens-per-second 50
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .text import APPROX_CHARS_PER_TOKEN
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections under concurrent load, which shows up as 1s retries
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_handler(latency: float, tokens_per_second: float | None):
+    class MockLLMHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+
+            prompt_chars = sum(len(m["content"]) for m in request["messages"])
+            prompt_tokens = prompt_chars // APPROX_CHARS_PER_TOKEN
+            completion_tokens = request.get("max_tokens") or 250
+            content = mock_completion(prompt_tokens, completion_tokens)
+
+            delay = latency
+            if tokens_per_second:
+                delay += completion_tokens / tokens_per_second
+            time.sleep(delay)
+
+            body = json.dumps(
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Don't print a line per request
+            pass
+
+    return MockLLMHandler
+
+
+def mock_completion(prompt_tokens: int, completion_tokens: int) -> str:
+    words_per_bullet = max(1, completion_tokens // 5)
+    bullet = " ".join(["mock"] * words_per_bullet)
+    return "\n".join(
+        f"- Bullet {i + 1} of a summary of {prompt_tokens} tokens: {bullet}"
+        for i in range(5)
+    )
+
+
+def start_mock_llm_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    tokens_per_second: float | None = None,
+) -> MockLLMServer:
+    """Starts the server on a background thread. Use port 0 to pick a free port, see server.server_address."""
+    server = MockLLMServer((host, port), make_handler(latency, tokens_per_second))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logging.info(f"Mock LLM server listening on {server.server_address}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to wait before responding"
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=None,
+        help="Simulated generation speed, adds max_tokens / rate seconds per request",
+    )
+    args = parser.parse_args()
+    server = MockLLMServer(
+        (args.host, args.port), make_handler(args.latency, args.tokens_per_second)
+    )
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}/v1/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,22 +6,63 @@ import logging
 
 from .text import MAX_CHUNK_LENGTH, split_text
 from .prompt import bullet_point_summary, paragraph_summary, critic_rebuttal
+from .telemetry import llm_requests, queue_depth, record_llm_usage, span
 import os
 
 env = os.environ.get("ENV")
 
 client = AsyncOpenAI(
-    base_url="https://mixtral-8x7b.lepton.run/api/v1/",
+    # Point this at a local OpenAI compatible server (e.g. summarizer.mock_llm) for testing
+    base_url=os.environ.get("LLM_BASE_URL", "https://mixtral-8x7b.lepton.run/api/v1/"),
     api_key=os.environ.get("LEPTON_API_KEY"),
 )
 summary_model = "mixtral-8x7b:lepton"
 # 10 reqs per min, see https://www.lepton.ai/docs/overview/model_apis
 rate_limit = AsyncLimiter(10, 60)
+# Background work such as pre-warming the cache may only use part of the budget,
+# so users sending links are not stuck behind it.
+background_rate_limit = AsyncLimiter(3, 60)
 
 
-async def rebuttal_openai(text: str) -> dict:
+async def rebuttal_openai(text: str, paragraph_summaries: list[str] | None = None) -> dict:
+    """
+    Writes a rebuttal of the text. Long texts are summarized chunk by chunk first, the same way as summarize_openai.
+    If paragraph_summaries are given (e.g. from an earlier summary of the same article), they are used instead of
+    summarizing the chunks again, so only one request is made.
+    """
+    if paragraph_summaries is None and len(text) <= MAX_CHUNK_LENGTH:
+        logging.info("Sending rebuttal request to OpenAI")
+        system, user, params = critic_rebuttal(text)
+        rebuttal = await completions(
+            model=summary_model,
+            system=system,
+            user=user,
+            max_tokens=params["max_tokens"],
+            temperature=params["temperature"],
+            is_json=False,
+        )
+        rebuttal_info = {
+            "rebuttal": rebuttal,
+            "model": summary_model,
+            "type": "rebuttal",
+        }
+        return rebuttal_info
+
+    if paragraph_summaries is None:
+        with span("chunk"):
+            chunks = split_text(text)
+        logging.info(
+            f"Text is too long at {len(text)} chars. Splitting into {len(chunks)} chunks and summarizing each chunk first."
+        )
+        summaries_tasks = [summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)]
+        paragraph_summaries = await asyncio.gather(*summaries_tasks)
+    else:
+        logging.info(
+            f"Reusing {len(paragraph_summaries)} stored paragraph summaries for rebuttal"
+        )
+
     logging.info("Sending rebuttal request to OpenAI")
-    system, user, params = critic_rebuttal(text)
+    system, user, params = critic_rebuttal("\n".join(paragraph_summaries))
     rebuttal = await completions(
         model=summary_model,
         system=system,
@@ -33,12 +74,13 @@ async def rebuttal_openai(text: str) -> dict:
     rebuttal_info = {
         "rebuttal": rebuttal,
         "model": summary_model,
-        "type": "rebuttal",
+        "type": "rebuttal_chunked",
+        "paragraph_summaries": paragraph_summaries,
     }
     return rebuttal_info
 
 
-async def summarize_openai(text: str) -> dict:
+async def summarize_openai(text: str, background: bool = False) -> dict:
     if len(text) <= MAX_CHUNK_LENGTH:
         logging.info("Sending bullet point summary request to OpenAI")
         system, user, params = bullet_point_summary(text)
@@ -49,6 +91,7 @@ async def summarize_openai(text: str) -> dict:
             max_tokens=params["max_tokens"],
             temperature=params["temperature"],
             is_json=False,
+            background=background,
         )
         summary_info = {
             "summary": summary,
@@ -58,13 +101,14 @@ async def summarize_openai(text: str) -> dict:
         return summary_info
 
     # Text is too long, split it into chunks
-    chunks = split_text(text)
+    with span("chunk"):
+        chunks = split_text(text)
     logging.info(
         f"Text is too long at {len(text)} chars. Splitting into {len(chunks)} chunks and summarizing each chunk first."
     )
     # We summarize each chunk into a paragraph summary first.
     # Then, we take all those paragraphs and turn them into a bullet point summary.
-    summaries_tasks = [summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)]
+    summaries_tasks = [summarize_chunk(i, chunk, background) for i, chunk in enumerate(chunks)]
     summaries = await asyncio.gather(*summaries_tasks)
 
     # Now we have a list of paragraph summaries. We turn them into a bullet point summary.
@@ -77,6 +121,7 @@ async def summarize_openai(text: str) -> dict:
         max_tokens=params["max_tokens"],
         temperature=params["temperature"],
         is_json=False,
+        background=background,
     )
     summary_info = {
         "summary": summary,
@@ -87,7 +132,7 @@ async def summarize_openai(text: str) -> dict:
     return summary_info
 
 
-async def summarize_chunk(i: int, chunk: str):
+async def summarize_chunk(i: int, chunk: str, background: bool = False):
     system, user, params = paragraph_summary(chunk)
     res = await completions(
         model=summary_model,
@@ -96,6 +141,7 @@ async def summarize_chunk(i: int, chunk: str):
         max_tokens=params["max_tokens"],
         temperature=params["temperature"],
         is_json=False,
+        background=background,
     )
     logging.info(f"Completed summarizing chunk {i}")
     return res
@@ -108,20 +154,42 @@ async def completions(
     max_tokens,
     temperature,
     is_json,
+    background=False,
 ):
+    if background:
+        queue_depth.inc(queue="llm_background_rate_limit")
+        try:
+            with span("background_rate_limit_wait"):
+                await background_rate_limit.acquire()
+        finally:
+            queue_depth.dec(queue="llm_background_rate_limit")
+
     # Rate limit
-    async with rate_limit:
+    queue_depth.inc(queue="llm_rate_limit")
+    try:
+        with span("rate_limit_wait"):
+            await rate_limit.acquire()
+    finally:
+        queue_depth.dec(queue="llm_rate_limit")
+
+    with span("llm_call", model=model):
         messages = [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ]
         response_format = {"type": "json_object"} if is_json else None
-        completion = await client.chat.completions.create(
-            model=model,
-            response_format=response_format,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stream=False,
-        )
+        try:
+            completion = await client.chat.completions.create(
+                model=model,
+                response_format=response_format,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=False,
+            )
+        except Exception:
+            llm_requests.inc(model=model, status="error")
+            raise
+        llm_requests.inc(model=model, status="ok")
+        record_llm_usage(model, completion.usage)
         return completion.choices[0].message.content
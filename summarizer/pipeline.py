@@ -0,0 +1,264 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from .compaction import compact_text
+from .database import (
+    create_article,
+    create_summaries,
+    make_summary_value,
+    read_article,
+    read_cached_summary,
+)
+from .openai_summarizer import summarize_openai, summary_model
+from .telemetry import queue_depth, record_cache_lookup, span
+from .text import (
+    canonicalize_url,
+    extract_text,
+    extract_title,
+    fetch_html,
+    is_known_failed_domains,
+    is_valid_url,
+)
+
+# Number of workers per stage. Fetching is network bound so it gets the most workers,
+# summarizing is bounded by the LLM rate limiter anyway. A single save worker collects the largest batches.
+DEFAULT_STAGE_CONCURRENCY = {
+    "cache": 4,
+    "fetch": 8,
+    "extract": 2,
+    "summarize": 4,
+    "save": 1,
+}
+# Each stage's input queue is bounded, so a slow stage makes the earlier stages wait
+# instead of piling up downloaded pages in memory.
+DEFAULT_QUEUE_SIZE = 8
+# Summaries finished around the same time are saved together, so the summaries table rows of one day go in
+# one transaction. The save stage waits this long for more summaries before saving what it has.
+SAVE_BATCH_SIZE = 20
+SAVE_BATCH_WAIT_SECONDS = 0.5
+
+
+async def check_cache(item: dict, options: dict) -> dict:
+    url = item["url"]
+    if not options["force"]:
+        cached_summary = await asyncio.to_thread(read_cached_summary, url, summary_model)
+        record_cache_lookup("summary", cached_summary is not None)
+        if cached_summary is not None:
+            item["status"] = "cached"
+            item["summary"] = cached_summary["summary"]
+            return item
+    cached_article = await asyncio.to_thread(read_article, url)
+    record_cache_lookup("article", cached_article is not None)
+    if cached_article is not None and "text" in cached_article:
+        item["text"] = cached_article["text"]
+        item["is_article_from_cache"] = True
+    return item
+
+
+async def fetch(item: dict, options: dict) -> dict:
+    if "text" in item:
+        return item
+    downloaded = await asyncio.to_thread(fetch_html, item["url"])
+    if downloaded is None:
+        item["status"] = "failed"
+        item["error"] = "Could not fetch the article"
+        return item
+    item["html"] = downloaded
+    return item
+
+
+async def extract(item: dict, options: dict) -> dict:
+    if "html" in item:
+        downloaded = item.pop("html")
+        item["text"] = await asyncio.to_thread(extract_text, downloaded)
+        if item["text"] is None:
+            item["status"] = "failed"
+            item["error"] = "Could not extract text from the article"
+            return item
+        # The title is only used in the digest, so a page we can't get it from is still summarized.
+        # E.g. lxml refuses str input with an XML encoding declaration.
+        try:
+            item["title"] = await asyncio.to_thread(extract_title, downloaded)
+        except Exception as e:
+            logging.warning(f"Could not extract title of {item['url']}. Err: {e}")
+            item["title"] = None
+    return item
+
+
+async def summarize(item: dict, options: dict) -> dict:
+    compacted_text, compaction_info = compact_text(item["text"], item["url"])
+    summary_info = await summarize_openai(compacted_text, options["background"])
+    summary_info["compaction"] = compaction_info
+    item["summary_info"] = summary_info
+    item["summary"] = summary_info["summary"]
+    return item
+
+
+async def save(items: list[dict], options: dict) -> list[dict]:
+    await asyncio.to_thread(save_results, items)
+    for item in items:
+        item["status"] = "summarized"
+    return items
+
+
+def save_results(items: list[dict]):
+    create_summaries(
+        [make_summary_value(item["summary_info"], item["url"], "digest") for item in items]
+    )
+    for item in items:
+        if not item.get("is_article_from_cache"):
+            create_article(item["url"], item["text"])
+
+
+STAGES = [
+    ("cache", check_cache),
+    ("fetch", fetch),
+    ("extract", extract),
+    ("summarize", summarize),
+    ("save", save),
+]
+# Stages whose function takes and returns a list of items
+BATCHED_STAGES = {"save": SAVE_BATCH_SIZE}
+
+
+async def stage_worker(name, next_name, fn, in_queue, out_queue, results, options):
+    while True:
+        item = await in_queue.get()
+        queue_depth.dec(queue=f"pipeline_{name}")
+        try:
+            with span(f"pipeline_{name}"):
+                item = await fn(item, options)
+        except Exception as e:
+            logging.error(f"Stage {name} failed for {item['url']}: {e}")
+            item["status"] = "failed"
+            item["error"] = str(e)
+        try:
+            await forward(item, next_name, out_queue, results)
+        finally:
+            in_queue.task_done()
+
+
+async def batch_stage_worker(
+    name, next_name, fn, in_queue, out_queue, results, options, batch_size
+):
+    while True:
+        batch = await get_batch(in_queue, batch_size)
+        queue_depth.dec(len(batch), queue=f"pipeline_{name}")
+        try:
+            with span(f"pipeline_{name}", batch_size=len(batch)):
+                batch = await fn(batch, options)
+        except Exception as e:
+            logging.error(f"Stage {name} failed for a batch of {len(batch)} items: {e}")
+            for item in batch:
+                item["status"] = "failed"
+                item["error"] = str(e)
+        try:
+            for item in batch:
+                await forward(item, next_name, out_queue, results)
+        finally:
+            for _ in batch:
+                in_queue.task_done()
+
+
+async def get_batch(in_queue: asyncio.Queue, batch_size: int) -> list[dict]:
+    """Waits for one item, then takes more as they arrive until the batch is full or none come for a while"""
+    batch = [await in_queue.get()]
+    while len(batch) < batch_size:
+        try:
+            batch.append(await asyncio.wait_for(in_queue.get(), SAVE_BATCH_WAIT_SECONDS))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+
+async def forward(item: dict, next_name, out_queue: asyncio.Queue, results: list):
+    if "status" in item:
+        # Item is done, either from the cache, failed or saved
+        item.pop("text", None)
+        item.pop("summary_info", None)
+        results.append(item)
+    else:
+        # Counted before putting, so the gauge never goes negative
+        queue_depth.inc(queue=f"pipeline_{next_name}")
+        await out_queue.put(item)
+
+
+def prepare_urls(urls: list[str]) -> tuple[list[str], list[dict]]:
+    """Canonicalizes and deduplicates the urls, and skips those we can't summarize"""
+    prepared = []
+    skipped = []
+    for url in dict.fromkeys(canonicalize_url(url) for url in urls):
+        if not is_valid_url(url) or is_known_failed_domains(url):
+            skipped.append({"url": url, "status": "skipped"})
+            continue
+        prepared.append(url)
+    return prepared, skipped
+
+
+async def run_pipeline(
+    urls: list[str],
+    concurrency: dict | None = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    force: bool = False,
+    background: bool = False,
+) -> list[dict]:
+    """
+    Streams the urls through the cache check, fetch, extract, summarize and save stages.
+    Each stage runs its own pool of workers. Returns one result per url, in order of completion.
+    If force is set, urls are summarized again even if there is a cached summary.
+    If background is set, LLM requests also go through the smaller background budget.
+    """
+    options = {"force": force, "background": background}
+    concurrency = {**DEFAULT_STAGE_CONCURRENCY, **(concurrency or {})}
+    prepared, results = prepare_urls(urls)
+    logging.info(f"Running pipeline on {len(prepared)} urls, skipped {len(results)}")
+
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in STAGES]
+    # The last stage never forwards items, but every worker needs an out queue
+    queues.append(asyncio.Queue())
+    workers = []
+    for i, (name, fn) in enumerate(STAGES):
+        next_name = STAGES[i + 1][0] if i + 1 < len(STAGES) else None
+        args = (name, next_name, fn, queues[i], queues[i + 1], results, options)
+        for _ in range(concurrency[name]):
+            if name in BATCHED_STAGES:
+                worker = batch_stage_worker(*args, BATCHED_STAGES[name])
+            else:
+                worker = stage_worker(*args)
+            workers.append(asyncio.create_task(worker))
+
+    try:
+        for url in prepared:
+            # Blocks when the cache stage is backed up
+            queue_depth.inc(queue=f"pipeline_{STAGES[0][0]}")
+            await queues[0].put({"url": url})
+        # Items only move forward, so once a queue is drained, everything is in the next queue
+        for queue in queues[:-1]:
+            await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    return results
+
+
+def format_digest(results: list[dict], date: datetime | None = None) -> str:
+    date = date or datetime.now()
+    lines = [f"# Digest for {date.strftime('%Y-%m-%d')}", ""]
+    summarized = [r for r in results if r["status"] in ("summarized", "cached")]
+    for result in summarized:
+        title = result.get("title") or result["url"]
+        lines.append(f"## {title}")
+        lines.append(result["url"])
+        lines.append("")
+        lines.append(result["summary"].strip())
+        lines.append("")
+    failed = [r for r in results if r["status"] in ("failed", "skipped")]
+    if len(failed) > 0:
+        lines.append("## Could not summarize")
+        for result in failed:
+            reason = result.get("error", result["status"])
+            lines.append(f"- {result['url']} ({reason})")
+        lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,279 @@
+"""
+Tracing and metrics for the summarizer.
+
+Spans go to OpenTelemetry when it is installed, so they can be exported to App Insights or any OTLP collector.
+Metrics are kept in process and served in the Prometheus text format, and also mirrored to OpenTelemetry.
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from opentelemetry import metrics as otel_metrics
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_metrics = None
+    otel_trace = None
+
+SERVICE_NAME = "url-summarizer-telegram-bot"
+# LLM calls take seconds, everything else milliseconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+_tracer = otel_trace.get_tracer(SERVICE_NAME) if otel_trace else None
+_meter = otel_metrics.get_meter(SERVICE_NAME) if otel_metrics else None
+_registry = []
+
+
+def _label_key(labelnames, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key) if value != ""]
+    if extra:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: list[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        self.otel = _meter.create_counter(name, description=help) if _meter else None
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        if self.otel is not None:
+            self.otel.add(amount, attributes=labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """A value that goes up and down, such as the number of requests waiting in a queue"""
+
+    def __init__(self, name: str, help: str, labelnames: list[str]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        self.otel = (
+            _meter.create_up_down_counter(name, description=help) if _meter else None
+        )
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        if self.otel is not None:
+            self.otel.add(amount, attributes=labels)
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames: list[str], buckets=DEFAULT_BUCKETS, unit=""
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label key -> [bucket counts..., sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+        self.otel = (
+            _meter.create_histogram(name, unit=unit, description=help) if _meter else None
+        )
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            counts = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+        if self.otel is not None:
+            self.otel.record(value, attributes=labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, counts in self.values.items():
+                for bound, count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {counts[-1]}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {counts[-2]}")
+                lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+stage_duration = Histogram(
+    "summarizer_stage_duration_seconds",
+    "Time spent in each stage of summarizing an article",
+    ["stage", "status"],
+    unit="s",
+)
+llm_requests = Counter(
+    "summarizer_llm_requests_total", "LLM requests", ["model", "status"]
+)
+llm_tokens = Counter(
+    "summarizer_llm_tokens_total",
+    "Prompt and completion tokens used, as reported by the LLM",
+    ["model", "kind"],
+)
+compaction_tokens = Counter(
+    "summarizer_compaction_tokens_total",
+    "Estimated article tokens before and after compaction",
+    ["kind"],
+)
+cache_lookups = Counter(
+    "summarizer_cache_lookups_total", "Cache lookups by result", ["cache", "result"]
+)
+queue_depth = Gauge(
+    "summarizer_queue_depth", "Items waiting in a queue or rate limiter", ["queue"]
+)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """Traces a stage and records its duration"""
+    start = time.perf_counter()
+    status = "ok"
+    otel_span = (
+        _tracer.start_as_current_span(name, attributes=attributes)
+        if _tracer
+        else contextlib.nullcontext()
+    )
+    with otel_span:
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            stage_duration.observe(time.perf_counter() - start, stage=name, status=status)
+
+
+def set_span_attributes(**attributes):
+    if otel_trace is None:
+        return
+    otel_trace.get_current_span().set_attributes(attributes)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_llm_usage(model: str, usage):
+    if usage is None:
+        return
+    llm_tokens.inc(usage.prompt_tokens, model=model, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens, model=model, kind="completion")
+    set_span_attributes(
+        prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens
+    )
+
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Don't log every scrape
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves /metrics on a background thread. Only on localhost by default, since it is unauthenticated."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def configure_otlp_export():
+    """Exports spans to an OTLP collector if OTEL_EXPORTER_OTLP_ENDPOINT is set"""
+    if not os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logging.warning(
+            "OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk or opentelemetry-exporter-otlp-proto-http is not installed"
+        )
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+    logging.info("Exporting traces with OTLP")
+
+
+def configure_app_insights():
+    """Sends spans and metrics to App Insights if APPLICATIONINSIGHTS_CONNECTION_STRING is set"""
+    if not os.environ.get("APPLICATIONINSIGHTS_CONNECTION_STRING"):
+        return
+    try:
+        from azure.monitor.opentelemetry import configure_azure_monitor
+    except ImportError:
+        logging.warning(
+            "APPLICATIONINSIGHTS_CONNECTION_STRING is set but azure-monitor-opentelemetry is not installed"
+        )
+        return
+    configure_azure_monitor()
+    logging.info("Exporting traces and metrics to App Insights")
@@ -1,8 +1,11 @@
 import math
 import trafilatura
 import logging
+from courlan import clean_url
 from lxml import html
 from typing import List
+from urllib.parse import urlparse
+from .telemetry import span
 
 
 def extract_title(html_str):
@@ -28,15 +31,64 @@ def extract_title(html_str):
     return None
 
 
-def get_text(url):
-    downloaded = trafilatura.fetch_url(url)
+def is_valid_url(url):
+    try:
+        result = urlparse(url)
+        return all([result.scheme, result.netloc])
+    except ValueError:
+        return False
+
+
+def is_known_failed_domains(url):
+    # Requests to these domains don't seem to work / are not supported yet
+    failed_domains = [
+        "www.reuters.com",
+        "reuters.com",
+        "youtube.com",
+        "twitter.com",
+        "facebook.com",
+        "instagram.com",
+        "pinterest.com",
+        "arxiv.org",
+        "archive.org",
+        "archive.is",
+        "archive.ph",
+        "bloomberg.com",  # Bloomberg has a robots blocker
+        "www.bloomberg.com",  # Bloomberg has a robots blocker
+        "www.ft.com",
+    ]
+    result = urlparse(url)
+    domain = result.netloc
+    return domain in failed_domains
+
+
+def canonicalize_url(url: str) -> str:
+    # Normalizes the url and strips tracking parameters, so the same article is cached under one key
+    cleaned = clean_url(url)
+    if cleaned is None:
+        return url
+    return cleaned
+
+
+def fetch_html(url):
+    with span("fetch"):
+        return trafilatura.fetch_url(url)
+
+
+def extract_text(downloaded):
     prune_xpath = ["//code", "//pre"]
 
-    return trafilatura.extract(
-        downloaded,
-        prune_xpath=prune_xpath,
-        include_tables=False,
-    )
+    with span("extract"):
+        return trafilatura.extract(
+            downloaded,
+            prune_xpath=prune_xpath,
+            include_tables=False,
+        )
+
+
+def get_text(url):
+    downloaded = fetch_html(url)
+    return extract_text(downloaded)
 
 
 def get_text_and_title(url):
@@ -0,0 +1,47 @@
+from summarizer.compaction import compact_text
+
+
+def test_removes_boilerplate_and_duplicates():
+    text = "\n".join(
+        [
+            "The mayor said on Tuesday that the new bridge would open next spring after years of delays.",
+            "Advertisement",
+            "Sign up for our daily newsletter",
+            "The mayor said on Tuesday that the new bridge would open next spring after years of delays!",
+            "the new bridge would open next spring after years of delays",
+            "Share this article",
+            "Photo: Reuters",
+        ]
+    )
+    compacted, info = compact_text(text, "https://www.example.com/bridge")
+    assert compacted == (
+        "The mayor said on Tuesday that the new bridge would open next spring after years of delays."
+    )
+    assert info["removed_boilerplate"] == 4
+    assert info["removed_duplicates"] == 2
+    assert info["tokens_after"] < info["tokens_before"]
+
+
+def test_keeps_article_paragraphs_that_mention_boilerplate_phrases():
+    paragraphs = [
+        "Publishers say more readers now choose to subscribe to newsletters than to pay for the website itself.",
+        "Share this story with your representative, the campaign urged supporters in a letter sent on Monday.",
+        "Click here to read the full report, the agency's website told visitors, but the link was broken for hours.",
+        "Readers who support the Guardian financially rose to more than a million last year, the paper said.",
+        "Related research shows that commuters switch to trains when fares fall by more than a tenth.",
+    ]
+    compacted, info = compact_text("\n".join(paragraphs), "https://www.theguardian.com/x")
+    assert compacted.split("\n") == paragraphs
+    assert info["removed_boilerplate"] == 0
+
+
+def test_strips_trailing_photo_credit_but_keeps_paragraph():
+    text = "Protesters gathered outside parliament on Friday to oppose the new law. (Photo: Reuters)"
+    compacted, _ = compact_text(text)
+    assert compacted == "Protesters gathered outside parliament on Friday to oppose the new law."
+
+
+def test_long_paragraph_starting_with_trigger_phrase_is_kept():
+    paragraph = "Read more: " + "the council published a detailed plan for the harbour. " * 5
+    compacted, _ = compact_text(paragraph.strip())
+    assert compacted == paragraph.strip()
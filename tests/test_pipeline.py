@@ -0,0 +1,139 @@
+import asyncio
+import os
+
+import pytest
+from aiolimiter import AsyncLimiter
+from openai import AsyncOpenAI
+
+# The OpenAI client is created on import and needs a key, even though the tests use a mock server
+os.environ.setdefault("LEPTON_API_KEY", "test")
+
+import summarizer.database as database
+import summarizer.openai_summarizer as openai_summarizer
+import summarizer.pipeline as pipeline
+from benchmarks.fakes import FakeContainerClient, FakeTableClient
+from summarizer.feeds import read_feeds
+from summarizer.mock_llm import start_mock_llm_server
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Bridge opens</title></head>
+<body><article>
+<p>The mayor said on Tuesday that the new harbour bridge would open to traffic next spring, after three years of delays.</p>
+<p>Construction crews worked through the winter to finish the steel deck, and final safety inspections are scheduled for February.</p>
+<p>Advertisement</p>
+<p>The bridge replaces a crossing built in 1932 that engineers rated as structurally deficient, forcing trucks onto a long detour.</p>
+</article></body></html>
+"""
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    clients = {
+        "summaries_table_client": FakeTableClient(),
+        "summaries_by_url_table_client": FakeTableClient(),
+        "summaries_by_user_table_client": FakeTableClient(),
+        "articles_container_client": FakeContainerClient(),
+    }
+    for name, client in clients.items():
+        monkeypatch.setattr(database, name, client)
+    return clients
+
+
+@pytest.fixture
+def mock_llm(monkeypatch):
+    server = start_mock_llm_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1/"
+    monkeypatch.setattr(
+        openai_summarizer, "client", AsyncOpenAI(base_url=base_url, api_key="test")
+    )
+    # Don't let the production rate limits slow down the tests
+    monkeypatch.setattr(openai_summarizer, "rate_limit", AsyncLimiter(1000, 1))
+    monkeypatch.setattr(openai_summarizer, "background_rate_limit", AsyncLimiter(1000, 1))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    def fetch_html(url):
+        return None if url.endswith("/missing") else PAGE
+
+    monkeypatch.setattr(pipeline, "fetch_html", fetch_html)
+
+
+def write_feed(tmp_path) -> str:
+    path = tmp_path / "feed.txt"
+    path.write_text(
+        "\n".join(
+            [
+                "# Today's links",
+                "https://example.com/a",
+                "https://example.com/a?utm_source=feed",
+                "https://example.com/b",
+                "https://example.com/missing",
+                "not-a-url",
+            ]
+        )
+    )
+    return f"file:{path}"
+
+
+def run_feed(feed: str) -> list[dict]:
+    async def run():
+        urls = await read_feeds([feed])
+        return await pipeline.run_pipeline(urls, background=True)
+
+    return asyncio.run(run())
+
+
+def statuses(results: list[dict]) -> dict:
+    return {result["url"]: result["status"] for result in results}
+
+
+def test_summarizes_file_feed_with_mock_llm(tmp_path, storage, mock_llm, pages):
+    results = run_feed(write_feed(tmp_path))
+
+    assert statuses(results) == {
+        "https://example.com/a": "summarized",
+        "https://example.com/b": "summarized",
+        "https://example.com/missing": "failed",
+        "not-a-url": "skipped",
+    }
+    summarized = [result for result in results if result["status"] == "summarized"]
+    assert all(result["title"] == "Bridge opens" for result in summarized)
+    assert all(result["summary"].startswith("- Bullet 1") for result in summarized)
+
+    rows = list(storage["summaries_table_client"].rows.values())
+    assert sorted(row["url"] for row in rows) == [
+        "https://example.com/a",
+        "https://example.com/b",
+    ]
+    for row in rows:
+        assert row["source"] == "digest"
+        assert row["type"] == "bullet_point"
+        assert row["summary_model"] == openai_summarizer.summary_model
+        assert row["tokens_after_compaction"] < row["tokens_before_compaction"]
+    # Both summaries are from the same day, so they are saved in one transaction
+    assert storage["summaries_table_client"].transactions == 1
+    assert len(storage["summaries_by_url_table_client"].rows) == 2
+    assert len(storage["summaries_by_user_table_client"].rows) == 0
+    assert len(storage["articles_container_client"].blobs) == 2
+
+
+def test_second_run_uses_cached_summaries(tmp_path, storage, mock_llm, pages):
+    feed = write_feed(tmp_path)
+    first = run_feed(feed)
+    second = run_feed(feed)
+
+    assert statuses(second) == {
+        "https://example.com/a": "cached",
+        "https://example.com/b": "cached",
+        "https://example.com/missing": "failed",
+        "not-a-url": "skipped",
+    }
+    first_summaries = {r["url"]: r["summary"] for r in first if "summary" in r}
+    second_summaries = {r["url"]: r["summary"] for r in second if "summary" in r}
+    assert second_summaries == first_summaries
+    # Nothing new was saved
+    assert len(storage["summaries_table_client"].rows) == 2
+    assert storage["summaries_table_client"].transactions == 1